@@ -2,10 +2,15 @@
 import time
 from machine import Pin,I2C
 
-RGB1602_SDA = Pin(4)
-RGB1602_SCL = Pin(5)
+# the bus is only set up when the first display is made (or one is
+# passed in) so importing this module doesn't touch the hardware
+RGB1602_I2C = None
 
-RGB1602_I2C = I2C(0,sda = RGB1602_SDA,scl = RGB1602_SCL ,freq = 400000)
+def bus():
+  global RGB1602_I2C
+  if RGB1602_I2C is None:
+    RGB1602_I2C = I2C(0,sda = Pin(4),scl = Pin(5) ,freq = 400000)
+  return RGB1602_I2C
 
 #Device I2C Arress
 LCD_ADDRESS   =  (0x7c>>1)
@@ -57,22 +62,48 @@ LCD_5x8DOTS = 0x00
 
 
 class RGB1602:
-  def __init__(self, col, row):
+  def __init__(self, col, row, i2c=None):
     self._row = row
     self._col = col
+    self._i2c = i2c if i2c is not None else bus()
+
+    # reusable transfer buffer for whole runs of characters:
+    # [0x80, ddram address, 0x40, chars...] sets the cursor and writes
+    # the data in a single I2C transaction (Co=1 command, then Co=0 data)
+    self._buf = bytearray(3 + col)
+    self._buf[0] = 0x80
+    self._buf[2] = 0x40
+    self._mv = memoryview(self._buf)
+    # a view for every length of run, so sending one doesn't allocate
+    self._runs = [self._mv[0:3 + n] for n in range(col + 1)] # with cursor move
+    self._data = [self._mv[2:3 + n] for n in range(col + 1)] # data only
+    self._one = bytearray(1) # for single byte commands and registers
+    self._cursor = bytearray(2)
+    self._cursor[0] = 0x80
+    self._glyph = bytearray(9) # [0x40, 8 rows] for createChar
+    self._glyph[0] = 0x40
+
+    # shadow framebuffer: _frame is what callers want on screen,
+    # _shown is what the LCD is currently displaying. flush() only
+    # sends the spans that differ between them.
+    self._frame = bytearray(b' ' * (row * col))
+    self._shown = bytearray(b' ' * (row * col))
 
     self._showfunction = LCD_4BITMODE | LCD_1LINE | LCD_5x8DOTS;
     self.begin(self._row,self._col)
 
         
   def command(self,cmd):
-    RGB1602_I2C.writeto_mem(LCD_ADDRESS, 0x80, chr(cmd))
+    self._one[0] = cmd
+    self._i2c.writeto_mem(LCD_ADDRESS, 0x80, self._one)
 
   def write(self,data):
-    RGB1602_I2C.writeto_mem(LCD_ADDRESS, 0x40, chr(data))
+    self._one[0] = data
+    self._i2c.writeto_mem(LCD_ADDRESS, 0x40, self._one)
     
   def setReg(self,reg,data):
-    RGB1602_I2C.writeto_mem(RGB_ADDRESS, reg, chr(data))
+    self._one[0] = data
+    self._i2c.writeto_mem(RGB_ADDRESS, reg, self._one)
 
 
   def setRGB(self,r,g,b):
@@ -85,17 +116,104 @@ class RGB1602:
       col|=0x80
     else:
       col|=0xc0;
-    RGB1602_I2C.writeto(LCD_ADDRESS, bytearray([0x80,col]))
+    self._cursor[1] = col
+    self._i2c.writeto(LCD_ADDRESS, self._cursor)
+
+  # load one of the 8 custom characters (codes 0-7), charmap is 8 rows
+  # of 5 bits with the leftmost column in bit 4. The LCD is left writing
+  # to CGRAM so move the cursor before printing again (flush() does).
+  def createChar(self,location,charmap):
+    self.command(LCD_SETCGRAMADDR | ((location & 7) << 3))
+    for i in range(8):
+      self._glyph[1 + i] = charmap[i] & 0x1f
+    self._i2c.writeto(LCD_ADDRESS, self._glyph)
 
   def clear(self):
     self.command(LCD_CLEARDISPLAY)
     time.sleep(0.002)
+    # the LCD is blank now so both buffers are too
+    for i in range(len(self._frame)):
+      self._frame[i] = 0x20
+      self._shown[i] = 0x20
+
+  def clearFrame(self):
+    # blank the framebuffer only, flush() will rub out what is shown
+    for i in range(len(self._frame)):
+      self._frame[i] = 0x20
+
+  def draw(self,col,row,arg):
+    # write text into the framebuffer, clipped to the line
+    self._fill(self._frame, row * self._col + col, arg, self._col - col)
+
+  def flush(self,frame=None):
+    # push the changed spans of each line to the LCD.
+    # a cursor move costs three bytes on the bus (0x80, address, 0x40)
+    # so spans separated by a gap that small are merged into one.
+    # frame can be a copy of _frame taken elsewhere (see dualcore.py).
+    sent = 0
+    buf = self._buf
+    if frame is None:
+      frame = self._frame
+    shown = self._shown
+    for row in range(self._row):
+      base = row * self._col
+      end = base + self._col
+      i = base
+      while i < end:
+        if frame[i] == shown[i]:
+          i += 1
+          continue
+        start = i
+        last = i
+        i += 1
+        while i < end and i - last <= 3:
+          if frame[i] != shown[i]:
+            last = i
+          i += 1
+        i = last + 1
+        n = i - start
+        if(row == 0):
+          buf[1] = 0x80 | (start - base)
+        else:
+          buf[1] = 0xc0 | (start - base)
+        for j in range(n):
+          buf[3 + j] = frame[start + j]
+          shown[start + j] = frame[start + j]
+        self._i2c.writeto(LCD_ADDRESS, self._runs[n])
+        sent += 3 + n
+    return sent
   def printout(self,arg):
+    # data only, continues from wherever the cursor is
+    n = self._fill(self._buf, 3, arg, self._col)
+    self._i2c.writeto(LCD_ADDRESS, self._data[n])
+
+  def printat(self,col,row,arg):
+    # cursor move and data in one transfer
+    if(row == 0):
+      self._buf[1] = 0x80 | col
+    else:
+      self._buf[1] = 0xc0 | col
+    n = self._fill(self._buf, 3, arg, self._col - col)
+    self._i2c.writeto(LCD_ADDRESS, self._runs[n])
+    # keep the framebuffers in step with what we just wrote
+    start = row * self._col + col
+    for j in range(n):
+      self._frame[start + j] = self._buf[3 + j]
+      self._shown[start + j] = self._buf[3 + j]
+
+  def _fill(self,dst,at,arg,limit):
+    # copy the characters into dst from index at, clipped to limit.
+    # bytes and bytearrays go straight in without allocating.
     if(isinstance(arg,int)):
       arg=str(arg)
-
-    for x in bytearray(arg,'utf-8'):
-      self.write(x)
+    if(isinstance(arg,str)):
+      arg=arg.encode()
+    n = len(arg)
+    if n > limit:
+      n = limit
+    for i in range(n):
+      dst[at + i] = arg[i]
+    return n
 
 
   def display(self):
@@ -112,17 +230,21 @@ class RGB1602:
 
     
      
-    time.sleep(0.05)
+    # the LCD needs 50ms after power on, which has usually
+    # gone by already (ticks_ms counts from reset)
+    wait = 50 - time.ticks_ms()
+    if wait > 0:
+      time.sleep_ms(wait)
 
 
     # Send function set command sequence
     self.command(LCD_FUNCTIONSET | self._showfunction)
     #delayMicroseconds(4500);  # wait more than 4.1ms
-    time.sleep(0.005)
+    time.sleep_us(4500)
     # second try
     self.command(LCD_FUNCTIONSET | self._showfunction);
     #delayMicroseconds(150);
-    time.sleep(0.005)
+    time.sleep_us(150)
     # third go
     self.command(LCD_FUNCTIONSET | self._showfunction)
     # finally, set # lines, font size, etc.
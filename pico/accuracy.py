@@ -0,0 +1,132 @@
+# Exposure accuracy log
+#
+# Records the tick (in microseconds) at which the relay actually closed and
+# opened for every segment of an exposure, pauses included, and compares
+# the total with what was asked for. Rolling statistics are kept so we can
+# show that a 4 second burn really is 4.00s on a given unit:
+#
+#   >>> v21_timer.exposure_log.report()
+#
+# at the REPL (or send "log" over serial, see remote.py), or set `verbose`
+# to have a line printed over USB serial as each exposure finishes.
+#
+# relay_on() and relay_off() are called from the exposure engine, possibly
+# in its timer callback, so they only store into preallocated arrays.
+
+from micropython import const
+from array import array
+import time
+
+MAX_SEGMENTS = const(16) # more pauses than this are folded into the last segment
+HISTORY = const(32)
+
+
+class ExposureLog:
+
+    def __init__(self):
+        self.verbose = False
+
+        # the exposure in progress
+        self.requested_us = 0
+        self.segments = 0
+        self.on_us = array('l', [0] * MAX_SEGMENTS)
+        self.off_us = array('l', [0] * MAX_SEGMENTS)
+        self.lit = False
+
+        # rolling statistics, overshoot is actual minus requested
+        self.count = 0 # exposures that ran without a pause
+        self.total_us = 0
+        self.max_us = 0
+        self.min_us = 0
+        self.paused_count = 0 # exposures with one or more pauses
+        self.paused_total_us = 0
+        self.paused_max_us = 0
+        self.cancelled = 0
+        self.history = array('l', [0] * HISTORY) # last overshoots
+        self.history_len = 0
+        self.history_next = 0
+
+    # a new exposure is about to start
+    def begin(self, requested_us):
+        self.requested_us = requested_us
+        self.segments = 0
+        self.lit = False
+
+    def relay_on(self, ticks_us):
+        if self.lit:
+            return
+        i = self.segments
+        if i == MAX_SEGMENTS:
+            # out of room, carry on the last segment and lose the gap
+            i -= 1
+            ticks_us = time.ticks_add(ticks_us, -time.ticks_diff(self.off_us[i], self.on_us[i]))
+        else:
+            self.segments = i + 1
+        self.on_us[i] = ticks_us
+        self.lit = True
+
+    def relay_off(self, ticks_us):
+        if not self.lit:
+            return
+        self.off_us[self.segments - 1] = ticks_us
+        self.lit = False
+
+    def cancel(self):
+        if self.segments:
+            self.cancelled += 1
+        self.segments = 0
+        self.lit = False
+
+    # total time the relay was closed for this exposure
+    def actual_us(self):
+        total = 0
+        for i in range(self.segments):
+            total += time.ticks_diff(self.off_us[i], self.on_us[i])
+        return total
+
+    # gap between segments, i.e. time spent paused
+    def paused_us(self):
+        total = 0
+        for i in range(1, self.segments):
+            total += time.ticks_diff(self.on_us[i], self.off_us[i - 1])
+        return total
+
+    # called from the main loop once the engine says it has finished
+    def finish(self):
+        if self.segments == 0 or self.lit:
+            return
+        overshoot = self.actual_us() - self.requested_us
+        if self.segments == 1:
+            if self.count == 0 or overshoot > self.max_us:
+                self.max_us = overshoot
+            if self.count == 0 or overshoot < self.min_us:
+                self.min_us = overshoot
+            self.count += 1
+            self.total_us += overshoot
+        else:
+            if self.paused_count == 0 or overshoot > self.paused_max_us:
+                self.paused_max_us = overshoot
+            self.paused_count += 1
+            self.paused_total_us += overshoot
+        self.history[self.history_next] = overshoot
+        self.history_next = (self.history_next + 1) % HISTORY
+        if self.history_len < HISTORY:
+            self.history_len += 1
+        if self.verbose:
+            print("exposure", self.requested_us, "us requested", self.actual_us(), "us lit",
+                  overshoot, "us over", self.segments - 1, "pauses", self.paused_us(), "us paused")
+        self.segments = 0
+
+    # to the REPL, or out (the remote's "log" command)
+    def report(self, out=None):
+        if self.count:
+            print("exposures", self.count, "mean overshoot", self.total_us // self.count,
+                  "us min", self.min_us, "us max", self.max_us, "us", file=out)
+        if self.paused_count:
+            print("paused exposures", self.paused_count, "mean overshoot",
+                  self.paused_total_us // self.paused_count, "us max", self.paused_max_us, "us", file=out)
+        if self.cancelled:
+            print("cancelled", self.cancelled, file=out)
+        if self.history_len:
+            start = (self.history_next - self.history_len) % HISTORY
+            print("last overshoots (us):", [self.history[(start + i) % HISTORY] for i in range(self.history_len)], file=out)
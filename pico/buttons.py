@@ -0,0 +1,124 @@
+# Interrupt driven buttons
+#
+# Each button has its own IRQ and its own debounce state so a press on one
+# can't hide a press on another. The hard IRQ only notes the time and hands
+# over to micropython.schedule, which turns edges into events in a
+# preallocated ring buffer. The main loop pops the events when it is ready.
+#
+# Events are PRESS on every press, DOUBLE as well if it came soon after the
+# last one and LONG once a button has been held down for a while.
+
+from machine import Pin
+from micropython import const
+from array import array
+import micropython
+import time
+
+PRESS = const(1)
+LONG = const(2)
+DOUBLE = const(3)
+
+DEBOUNCE_MS = const(50)
+LONG_MS = const(800)
+DOUBLE_MS = const(400)
+
+
+class Buttons:
+
+    def __init__(self, pin_nums, size=16):
+        self._pins = [Pin(n, Pin.IN, Pin.PULL_UP) for n in pin_nums]
+        n = len(pin_nums)
+        self._edge = array('i', [0] * n) # ticks of the last raw edge, set in the IRQ
+        self._settled = array('i', [0] * n) # ticks of the last accepted edge
+        self._pressed = array('i', [0] * n) # ticks of the last press
+        self._held = bytearray(n) # 1 while the button is down
+        self._long = bytearray(n) # 1 once LONG has been sent for this press
+        self._double = bytearray(n) # 1 if the next press could be a double
+
+        # event ring buffer
+        self._size = size
+        self._ev_btn = bytearray(size)
+        self._ev_kind = bytearray(size)
+        self._ev_ms = array('i', [0] * size)
+        self._head = 0
+        self._count = 0
+        self.dropped = 0 # events lost because the ring was full
+
+        self.on_event = None # optional, called when an event is queued
+
+        # bind once so the IRQ doesn't allocate
+        self._process_cb = self._process
+        for pin in self._pins:
+            pin.irq(self._irq, Pin.IRQ_FALLING | Pin.IRQ_RISING, hard=True)
+
+    def pending(self):
+        return self._count
+
+    # oldest event as (button index, kind, ticks_ms)
+    def pop(self):
+        if self._count == 0:
+            return None
+        i = self._head
+        self._head = (self._head + 1) % self._size
+        self._count -= 1
+        return self._ev_btn[i], self._ev_kind[i], self._ev_ms[i]
+
+    def value(self, btn):
+        return self._held[btn]
+
+    # called from the main loop: long presses and any edge we lost in a bounce
+    def poll(self):
+        now = time.ticks_ms()
+        for i in range(len(self._pins)):
+            if self._held[i] != (self._pins[i].value() == 0):
+                if time.ticks_diff(now, self._settled[i]) >= DEBOUNCE_MS:
+                    self._edge[i] = now
+                    self._process(i)
+            if self._held[i] and not self._long[i]:
+                if time.ticks_diff(now, self._pressed[i]) >= LONG_MS:
+                    self._long[i] = 1
+                    self._push(i, LONG, now)
+
+    # hard IRQ - note the time and get out
+    def _irq(self, pin):
+        for i in range(len(self._pins)):
+            if self._pins[i] is pin:
+                self._edge[i] = time.ticks_ms()
+                try:
+                    micropython.schedule(self._process_cb, i)
+                except RuntimeError:
+                    pass # schedule queue full, poll() will catch up
+                return
+
+    # scheduled - debounce and turn the edge into events
+    def _process(self, i):
+        down = self._pins[i].value() == 0
+        if down == self._held[i]:
+            return
+        t = self._edge[i]
+        if time.ticks_diff(t, self._settled[i]) < DEBOUNCE_MS:
+            return # bounce
+        self._settled[i] = t
+        self._held[i] = down
+        if not down:
+            return
+        self._long[i] = 0
+        self._push(i, PRESS, t)
+        if self._double[i] and time.ticks_diff(t, self._pressed[i]) < DOUBLE_MS:
+            self._push(i, DOUBLE, t)
+            self._double[i] = 0 # a third press starts again
+        else:
+            self._double[i] = 1
+        self._pressed[i] = t
+
+    def _push(self, btn, kind, t):
+        if self._count == self._size:
+            self.dropped += 1
+            return
+        i = (self._head + self._count) % self._size
+        self._ev_btn[i] = btn
+        self._ev_kind[i] = kind
+        self._ev_ms[i] = t
+        self._count += 1
+        if self.on_event is not None:
+            self.on_event()
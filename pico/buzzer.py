@@ -0,0 +1,123 @@
+# Buzzer tone sequencer
+#
+# Notes are queued as (freq, duty, duration) and played by a one-shot
+# timer that fires on each note boundary, so nothing ever sleeps and the
+# PWM is only touched when a note starts or the queue runs dry.
+# A second timer provides metronome ticks on whole second boundaries.
+
+from machine import Pin, PWM, Timer
+from array import array
+
+
+class Buzzer:
+
+    def __init__(self, pin_num, size=8):
+        self.pwm = PWM(Pin(pin_num, Pin.OUT), freq=200, duty_u16=32000)
+        self.pwm.deinit() # silence it immediately
+
+        # preallocated ring of notes
+        self._size = size
+        self._freq = array('H', [0] * size)
+        self._duty = array('H', [0] * size)
+        self._ms = array('H', [0] * size)
+        self._head = 0
+        self._count = 0
+        self._playing = False
+        self._timer = Timer()
+        self._next_cb = self._next # bind once so the callbacks don't allocate
+
+        # metronome
+        self._metro = Timer()
+        self._beats = 0 # ticks left to play, negative is forever
+        self._tick_freq = 0
+        self._tick_duty = 0
+        self._tick_ms = 0
+        self._tick_cb = self._tick
+        self._beat_cb = self._beat
+
+    # add a note to the queue, freq 0 is a rest
+    def play(self, freq, duty, ms):
+        if self._count == self._size:
+            return # full, drop it rather than block
+        i = (self._head + self._count) % self._size
+        self._freq[i] = freq
+        self._duty[i] = duty
+        self._ms[i] = ms
+        self._count += 1
+        if not self._playing:
+            self._next(None)
+
+    def rest(self, ms):
+        self.play(0, 0, ms)
+
+    # a tick on each whole second of a countdown with remaining_ms to go
+    # (not at zero, that is when the end of exposure sounds)
+    def countdown(self, remaining_ms, freq, duty, ms):
+        beats = (remaining_ms - 1) // 1000
+        if beats <= 0:
+            self.stop_metronome()
+            return
+        self._start_metronome(remaining_ms - beats * 1000, beats, freq, duty, ms)
+
+    # a tick every second until stopped
+    def metronome(self, freq, duty, ms):
+        self._start_metronome(1000, -1, freq, duty, ms)
+
+    def stop_metronome(self):
+        self._metro.deinit()
+        self._beats = 0
+
+    # silence everything and empty the queue
+    def stop(self):
+        self.stop_metronome()
+        self._timer.deinit()
+        self._count = 0
+        if self._playing:
+            self._playing = False
+            self.pwm.deinit()
+
+    # a note playing or the metronome going
+    def busy(self):
+        return self._playing or self._beats != 0
+
+    def _start_metronome(self, first_ms, beats, freq, duty, ms):
+        self._metro.deinit()
+        self._beats = beats
+        self._tick_freq = freq
+        self._tick_duty = duty
+        self._tick_ms = ms
+        # the first tick lines up the boundary, after that it is periodic
+        self._metro.init(mode=Timer.ONE_SHOT, period=first_ms, callback=self._tick_cb)
+
+    # timer callback for the first tick
+    def _tick(self, timer):
+        if self._beats != 1:
+            self._metro.init(mode=Timer.PERIODIC, period=1000, callback=self._beat_cb)
+        self._beat(timer)
+
+    # timer callback for each tick
+    def _beat(self, timer):
+        if self._beats == 0:
+            self._metro.deinit()
+            return
+        if self._beats > 0:
+            self._beats -= 1
+            if self._beats == 0:
+                self._metro.deinit()
+        self.play(self._tick_freq, self._tick_duty, self._tick_ms)
+
+    # timer callback on each note boundary
+    def _next(self, timer):
+        if self._count == 0:
+            self.pwm.deinit()
+            self._playing = False
+            return
+        i = self._head
+        self._head = (self._head + 1) % self._size
+        self._count -= 1
+        self._playing = True
+        if self._freq[i]:
+            self.pwm.init(freq=self._freq[i], duty_u16=self._duty[i])
+        else:
+            self.pwm.deinit()
+        self._timer.init(mode=Timer.ONE_SHOT, period=self._ms[i], callback=self._next_cb)
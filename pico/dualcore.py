@@ -0,0 +1,122 @@
+# Dual core runtime
+#
+# Another alternative to the spin loop at the bottom of main.py. The RP2040
+# has two cores and the slow part of the loop is I2C traffic to the LCD, so
+# the second core is given the LCD and nothing else:
+#   core 0 - encoder, buttons, the exposure timer and the lamp. It still
+#            works out what the screen should show (into the LCD's frame,
+#            no I2C) and posts a copy of the frame to the mailbox.
+#   core 1 - takes the latest frame from the mailbox and flushes it.
+# The mailbox holds a single frame. If core 1 is busy a newer frame simply
+# replaces the one waiting, the LCD only ever needs to catch up with the
+# latest. The lock is only held while a frame is copied so core 0 is never
+# kept waiting for the bus.
+#
+# Soft timer callbacks (the exposure engine) are scheduled on core 0, so
+# with no I2C on that core the lamp goes off on time whatever the display
+# is doing.
+
+from micropython import const
+import _thread
+import time
+
+IDLE_MS = const(5) # how long core 1 sleeps when there is nothing to draw
+
+
+class Mailbox:
+
+    def __init__(self, size):
+        self.lock = _thread.allocate_lock()
+        self.slot = bytearray(size)
+        self.full = False
+        self.posted = 0
+        self.replaced = 0 # frames overwritten before core 1 got to them
+
+    # core 0, copy a frame in (replacing any still waiting)
+    def post(self, frame):
+        slot = self.slot
+        self.lock.acquire()
+        if self.full:
+            self.replaced += 1
+        for i in range(len(slot)):
+            slot[i] = frame[i]
+        self.full = True
+        self.posted += 1
+        self.lock.release()
+
+    # core 1, copy the waiting frame out, False if there isn't one
+    def take(self, frame):
+        if not self.full:
+            return False
+        slot = self.slot
+        self.lock.acquire()
+        for i in range(len(slot)):
+            frame[i] = slot[i]
+        self.full = False
+        self.lock.release()
+        return True
+
+
+class DualCore:
+
+    def __init__(self, v21):
+        self.v21 = v21
+        size = len(v21.lcd._frame)
+        self.mailbox = Mailbox(size)
+        self.frame = bytearray(size) # core 1's own copy, flushed from
+        self.running = False
+        self.flushes = 0
+        self.bytes_sent = 0
+        self.errors = 0
+
+    # runs on core 1 and owns the LCD from here on
+    def display_loop(self):
+        lcd = self.v21.lcd
+        frame = self.frame
+        while self.running:
+            if self.mailbox.take(frame):
+                try:
+                    self.bytes_sent += lcd.flush(frame)
+                except OSError:
+                    self.errors += 1 # try again with the next frame
+                self.flushes += 1
+            else:
+                time.sleep_ms(IDLE_MS)
+
+    # one time round the loop on core 0, no I2C
+    def tick(self):
+        v21 = self.v21
+        v21.watchdog.feed()
+        if v21.watchdog.tripped: v21.lamp_cut()
+        v21.poll_encoder()
+        v21.poll_buttons()
+        v21.poll_remote()
+        v21.poll_sensor()
+        if v21.draw_display():
+            self.mailbox.post(v21.lcd._frame)
+        v21.update_timer()
+        v21.update_lamp()
+        v21.update_settings()
+        v21.idle.poll()
+
+    def start(self):
+        self.running = True
+        _thread.start_new_thread(self.display_loop, ())
+
+    # from the REPL, core 1 finishes its current flush and stops
+    def stop(self):
+        self.running = False
+
+    def report(self):
+        print("frames posted", self.mailbox.posted, "replaced before drawing", self.mailbox.replaced,
+              "flushes", self.flushes, "bytes sent", self.bytes_sent, "errors", self.errors)
+
+
+def run(v21):
+    dual = DualCore(v21)
+    dual.start()
+    while True:
+        try:
+            dual.tick()
+        except OSError as e:
+            v21.watchdog.error(e)
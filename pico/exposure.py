@@ -0,0 +1,181 @@
+# Exposure engine
+#
+# The lamp relay is switched off by a timer callback at the end of the
+# exposure rather than by the main loop, so time spent writing to the
+# display or polling buttons can't stretch the exposure.
+# The main loop just looks at `finished` afterwards to change mode.
+#
+# Everything is kept as integer microseconds against an absolute ticks_us
+# deadline. machine.Timer only counts whole milliseconds so it is armed a
+# little early and the callback waits out the last fraction itself.
+# ticks_us wraps after about 17 minutes so long exposures are run as a
+# chain of shorter spans, each deadline following on from the last.
+#
+# A program (see program.py) is a list of segments run the same way: when
+# one ends the next is timed from its deadline with the lamp left on, or,
+# if the segment is marked to wait, the lamp goes off and `waiting` is set
+# until resume() is called.
+
+from machine import Timer
+from micropython import const
+import machine
+import time
+
+EARLY_US = const(2000) # how far ahead of the deadline the timer fires
+SPAN_US = const(300000000) # longest span timed against one deadline
+
+
+class Exposure:
+
+    def __init__(self, lamp, log=None):
+        self.lamp = lamp # the relay pin, we own it while running
+        self.log = log # optional accuracy.ExposureLog
+        self.timer = Timer()
+        self.running = False # lamp on and timer armed
+        self.finished = False # set by the callback, cleared by the main loop
+        self.remaining = 0 # microseconds left when not running
+        self.end = 0 # ticks_us deadline of the current span when running
+        self.beyond = 0 # microseconds still to run after the current span
+        self.on_finish = None # optional, called from the callback (must be IRQ safe)
+        self.program = None # microsecond durations of each segment if running a program
+        self.waits = None # and whether to wait before each one
+        self.count = 1 # segments in the program
+        self.segment = 0 # the segment running (or waiting to run)
+        self.waiting = False # lamp off between program segments until resume()
+        self._expired_cb = self._expired # bind once so the callback doesn't allocate
+
+    # start a new exposure of duration_us
+    def start(self, duration_us):
+        self.cancel()
+        self.remaining = duration_us
+        if self.log is not None:
+            self.log.begin(duration_us)
+        self.resume()
+
+    # start the first count segments of a program, durations in microseconds
+    def start_program(self, durations, waits, count):
+        self.cancel()
+        self.program = durations
+        self.waits = waits
+        self.count = count
+        self.remaining = durations[0]
+        if self.log is not None:
+            # waits are logged like pauses, it is the total that matters
+            total = 0
+            for i in range(count):
+                total += durations[i]
+            self.log.begin(total)
+        self.resume()
+
+    # (re)start the lamp for whatever is remaining
+    def resume(self):
+        if self.running:
+            return
+        self.waiting = False
+        while self.remaining <= 0:
+            # nothing to time, on to the next segment or finished without
+            # the lamp going on, so the main loop still sees it move on
+            segment = self.segment + 1
+            if segment >= self.count:
+                self.remaining = 0
+                self.finished = True
+                if self.on_finish is not None:
+                    self.on_finish()
+                return
+            self.segment = segment
+            self.remaining = self.program[segment]
+            if self.waits[segment]:
+                self.waiting = True
+                return
+        self.running = True
+        self.lamp.value(1)
+        now = time.ticks_us()
+        if self.log is not None:
+            self.log.relay_on(now)
+        self.beyond = self.remaining
+        self.end = now
+        self._next_span()
+
+    # set the deadline for the next span and arm the timer for it
+    def _next_span(self):
+        span = min(self.beyond, SPAN_US)
+        self.beyond -= span
+        self.end = time.ticks_add(self.end, span)
+        wait_ms = (time.ticks_diff(self.end, time.ticks_us()) - EARLY_US) // 1000
+        if wait_ms > 0:
+            self.timer.init(mode=Timer.ONE_SHOT, period=wait_ms, callback=self._expired_cb)
+        else:
+            # too short for the timer, just wait for it here
+            self._expired(None)
+
+    # stop the lamp but remember how much is left, at is the ticks_us
+    # the lamp really went off if that was earlier (see watchdog.py)
+    def pause(self, at=None):
+        irq = machine.disable_irq()
+        if self.running:
+            self.timer.deinit()
+            self.lamp.value(0)
+            now = time.ticks_us() if at is None else at
+            if self.log is not None:
+                self.log.relay_off(now)
+            self.running = False
+            self.remaining = max(0, time.ticks_diff(self.end, now)) + self.beyond
+            if self.remaining == 0:
+                self.finished = True
+        machine.enable_irq(irq)
+
+    # stop the lamp and forget the exposure
+    def cancel(self):
+        irq = machine.disable_irq()
+        self.timer.deinit()
+        self.lamp.value(0)
+        if self.log is not None:
+            if self.running:
+                self.log.relay_off(time.ticks_us())
+            self.log.cancel()
+        self.running = False
+        self.finished = False
+        self.remaining = 0
+        self.program = None
+        self.count = 1
+        self.segment = 0
+        self.waiting = False
+        machine.enable_irq(irq)
+
+    def remaining_us(self):
+        if self.running:
+            return max(0, time.ticks_diff(self.end, time.ticks_us())) + self.beyond
+        return self.remaining
+
+    # timer callback - the lamp goes off here, not in the main loop
+    def _expired(self, timer):
+        if not self.running:
+            return # paused (or cut) after this was queued
+        end = self.end
+        while time.ticks_diff(end, time.ticks_us()) > 0:
+            pass
+        if self.beyond:
+            # a long exposure, carry straight on from this deadline
+            self._next_span()
+            return
+        segment = self.segment + 1
+        if segment < self.count:
+            self.segment = segment
+            if not self.waits[segment]:
+                # the next segment of a program, timed from this deadline
+                self.beyond = self.program[segment]
+                self._next_span()
+                return
+        self.lamp.value(0)
+        if self.log is not None:
+            self.log.relay_off(time.ticks_us())
+        self.running = False
+        if segment < self.count:
+            # the next segment waits to be resumed
+            self.remaining = self.program[segment]
+            self.waiting = True
+            return
+        self.remaining = 0
+        self.finished = True
+        if self.on_finish is not None:
+            self.on_finish()
@@ -0,0 +1,102 @@
+# F-stop tables
+#
+# Stops are counted in whole clicks of the encoder, a tenth, a sixth or a
+# third of a stop each depending on the resolution, and go to just under
+# ten stops either way, so there are only 2 * limit + 1 of them. The
+# multiplier 2^(clicks/resolution) for each is worked out once per
+# resolution (the first time it is used) and the durations for the base
+# only when the base changes, so turning the encoder and redrawing are
+# an index into an array.
+#
+# The table holds whole milliseconds. Microseconds would overflow the 32
+# bit array long before the top of the table (16s at +9.9 stops is over
+# 2^31us) and single precision floats can't give microseconds that far up
+# anyway. They come out in microseconds, like the exposure engine's.
+# Nothing in the table is under 1ms, a run of 0 would never start.
+
+from micropython import const
+from array import array
+
+MAX_MS = const(0x7fffffff) # the most an entry can hold, longer bases stop here
+MIN_BASE = 0.1 # seconds, the least the display shows
+MAX_BASE = const(2147483) # seconds, MAX_MS, the most the table can time
+
+RESOLUTIONS = (10, 6, 3) # clicks per stop
+
+_multipliers = {} # resolution -> array of 2^(clicks/resolution) from -limit
+
+
+def limit(resolution):
+    return 10 * resolution - 1
+
+
+def multipliers(resolution):
+    table = _multipliers.get(resolution)
+    if table is None:
+        n = limit(resolution)
+        table = array('f', [pow(2, (i - n) / resolution) for i in range(2 * n + 1)])
+        _multipliers[resolution] = table
+    return table
+
+
+class StopTable:
+
+    def __init__(self, resolution=10):
+        self.base = None
+        self.base_us = 0
+        self.set_resolution(resolution)
+
+    def set_resolution(self, resolution):
+        if resolution not in RESOLUTIONS:
+            raise ValueError("resolution")
+        self.resolution = resolution
+        self.limit = limit(resolution)
+        self.multipliers = multipliers(resolution)
+        self.durations = array('l', [0] * len(self.multipliers))
+        self.base = None # rebuilt on the next update()
+
+    # work the durations out again if the base has changed
+    def update(self, base):
+        if base == self.base:
+            return
+        self.base = base
+        base_ms = base * 1000
+        durations = self.durations
+        multipliers = self.multipliers
+        for i in range(len(durations)):
+            durations[i] = max(1, int(min(base_ms * multipliers[i] + 0.5, MAX_MS)))
+        self.base_us = durations[self.limit] * 1000 # so no clicks is no burn
+
+    def clamp(self, clicks):
+        return max(-self.limit, min(self.limit, clicks))
+
+    # microseconds for the base moved by clicks
+    def duration_us(self, clicks):
+        return self.durations[self.clamp(clicks) + self.limit] * 1000
+
+    # microseconds to add to the base to give it clicks more
+    def burn_us(self, clicks):
+        return self.duration_us(clicks) - self.base_us
+
+    # clicks from this resolution to another, to the nearest
+    def convert(self, clicks, resolution):
+        n = (abs(clicks) * resolution * 2 + self.resolution) // (self.resolution * 2)
+        return n if clicks >= 0 else -n
+
+    # clicks as a number of stops
+    def stops(self, clicks):
+        return clicks / self.resolution
+
+    # the nearest clicks to a number of stops
+    def clicks(self, stops):
+        return self.clamp(int(round(stops * self.resolution)))
+
+    # for the display, "+1.3", "-0.67", "0.0", worked out in whole numbers
+    # so there are no float leftovers like 0.30000000000000004
+    def label(self, clicks):
+        sign = "+" if clicks > 0 else "-" if clicks < 0 else ""
+        clicks = abs(clicks)
+        whole, part = divmod(clicks, self.resolution)
+        if self.resolution == 10:
+            return f"{sign}{whole}.{part}"
+        return f"{sign}{whole}.{(part * 100 + self.resolution // 2) // self.resolution:02d}"
@@ -0,0 +1,64 @@
+# Heap guard for exposures
+#
+# A garbage collection can take several milliseconds and must not land in
+# the middle of an exposure. So we collect deliberately just before the
+# lamp goes on and switch automatic collection off until it goes off
+# again; the Run mode code is written not to allocate in between.
+# We keep track of how close the heap came to running out while
+# collection was off so we know this is safe:
+#
+#   >>> v21_timer.heap.report()
+#
+# or send "heap" over serial (see remote.py).
+
+from micropython import const
+import gc
+
+LOW_WATER = const(8192) # turn collection back on if free heap drops below this
+
+
+class HeapGuard:
+
+    def __init__(self):
+        self.holding = False
+        self.free_at_start = 0 # free heap after the collect before the lamp went on
+        self.least_free = -1 # lowest free heap seen while holding, -1 until measured
+        self.most_used = 0 # most heap used during one hold
+        self.rescued = 0 # times collection had to be turned back on early
+
+    # just before the lamp goes on
+    def hold(self):
+        if self.holding:
+            return
+        gc.collect()
+        gc.disable()
+        self.holding = True
+        self.free_at_start = gc.mem_free()
+
+    # while running, now and then (not every loop, mem_free walks the heap)
+    def check(self):
+        if not self.holding:
+            return
+        free = gc.mem_free()
+        if self.least_free < 0 or free < self.least_free:
+            self.least_free = free
+        if free < LOW_WATER:
+            # better a pause in the exposure than running out of memory
+            gc.enable()
+            self.rescued += 1
+
+    # once the lamp is off
+    def release(self):
+        if not self.holding:
+            return
+        self.check()
+        used = self.free_at_start - gc.mem_free()
+        if used > self.most_used:
+            self.most_used = used
+        self.holding = False
+        gc.enable()
+
+    # to the REPL, or out (the remote's "heap" command)
+    def report(self, out=None):
+        print("free heap now", gc.mem_free(), "least free while running", self.least_free,
+              "most used in one exposure", self.most_used, "early collections", self.rescued, file=out)
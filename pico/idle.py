@@ -0,0 +1,115 @@
+# Idle policy
+#
+# Sitting in Expose, Burn, Test or Program waiting for someone to touch a
+# control, the loop would otherwise go round flat out at 125 MHz doing
+# nothing. Once the state hasn't changed for IDLE_MS, with the lamp off
+# and the buzzer quiet, the clock is dropped to SLOW_HZ and every time
+# round the loop ends with a nap of up to NAP_MS in machine.idle(), which
+# waits for the next interrupt. The buttons (and the IRQ encoder) wake it
+# on an edge, the PIO encoder has no interrupt and is checked after each
+# wait. The first change to the state puts the clock back to full speed,
+# and so does every press of Run before it starts an exposure.
+#
+# 48 MHz is as low as it goes without upsetting USB. PWM is clocked from
+# the system clock so the buzzer has to be quiet first, and anything that
+# starts a note wakes us up before it does. clk_peri follows the system
+# clock too, so the I2C is about 2.6 times slower (the 400 kHz bus runs
+# at about 154 kHz and a full redraw takes that much longer) and the PIO
+# encoder samples about 2.6 times less often, still far faster than a
+# hand can turn it.
+#
+# The longest time an input could wait for the loop while slow (a whole
+# nap then a slow iteration) is kept so it can be checked against
+# WAKE_TARGET_US, along with how long the clock takes to come back:
+#
+#   >>> v21_timer.idle.report()
+#
+# or send "idle" over serial (see remote.py).
+
+from micropython import const
+import machine
+import time
+
+SLOW_HZ = const(48000000)
+IDLE_MS = const(2000) # quiet for this long before slowing down
+NAP_MS = const(10)
+WAKE_TARGET_US = const(20000)
+
+MODES = ("Expose", "Burn", "Test", "Program")
+
+
+class IdlePolicy:
+
+    def __init__(self, v21):
+        self.v21 = v21
+        self.full_hz = machine.freq() # whatever it was started at
+        self.watcher = v21.state.watch()
+        self.quiet_since = time.ticks_ms()
+        self.slow = False
+        self.last_us = time.ticks_us() # when poll() last ran while slow
+
+        # figures
+        self.naps = 0
+        self.slowdowns = 0
+        self.slow_ms = 0 # time spent at SLOW_HZ
+        self.slow_from = 0
+        self.worst_us = 0 # longest poll to poll while slow, the worst wake latency
+        self.restore_us = 0 # longest machine.freq() back to full
+
+    # anything that should stop us napping
+    def _busy(self):
+        v21 = self.v21
+        return (v21.state.mode not in MODES or v21.exposure.running
+                or v21.lamp.value() or v21.buzzer.busy())
+
+    # end of each loop iteration
+    def poll(self):
+        now = time.ticks_ms()
+        if self.v21.state.take(self.watcher) or self._busy():
+            self.quiet_since = now
+            self.wake()
+            return
+        if not self.slow:
+            if time.ticks_diff(now, self.quiet_since) < IDLE_MS:
+                return
+            machine.freq(SLOW_HZ)
+            self.slow = True
+            self.slow_from = now
+            self.slowdowns += 1
+            self.last_us = time.ticks_us()
+        else:
+            t = time.ticks_us()
+            spent = time.ticks_diff(t, self.last_us)
+            if spent > self.worst_us:
+                self.worst_us = spent
+            self.last_us = t
+        self.nap()
+
+    # wait for an interrupt, a button or the encoder, at most NAP_MS
+    def nap(self):
+        v21 = self.v21
+        self.naps += 1
+        start = time.ticks_ms()
+        position = v21.encoder.value()
+        while time.ticks_diff(time.ticks_ms(), start) < NAP_MS:
+            machine.idle()
+            if v21.buttons.pending() or v21.encoder.value() != position:
+                break
+
+    # full speed again, before anything that needs it
+    def wake(self):
+        if not self.slow:
+            return
+        start = time.ticks_us()
+        machine.freq(self.full_hz)
+        spent = time.ticks_diff(time.ticks_us(), start)
+        if spent > self.restore_us:
+            self.restore_us = spent
+        self.slow = False
+        self.slow_ms += time.ticks_diff(time.ticks_ms(), self.slow_from)
+
+    # to the REPL, or out (the remote's "idle" command)
+    def report(self, out=None):
+        print("slowdowns", self.slowdowns, "naps", self.naps, "slow for", self.slow_ms, "ms",
+              "worst wake", self.worst_us, "us", "over target" if self.worst_us > WAKE_TARGET_US else "ok",
+              "clock back in", self.restore_us, "us", file=out)
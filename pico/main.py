@@ -1,13 +1,53 @@
 # Launch file for the application
 
-from rotary_irq_rp2 import RotaryIRQ
+import time
+
+# boot timeline, (what, ticks_us) and ticks_us counts from reset so the
+# first mark is how long the interpreter took to get here
+boot_marks = [("main.py", time.ticks_us())]
+
+try:
+    from rotary_pio_rp2 import RotaryPIO as Encoder # decoded in hardware
+except ImportError:
+    from rotary_irq_rp2 import RotaryIRQ as Encoder # no PIO (e.g. in ../sim)
+from exposure import Exposure
+from accuracy import ExposureLog
+from heap import HeapGuard
+from buzzer import Buzzer
+from sensor import LightSensor
+from settings import Settings
+from remote import Remote
+from watchdog import Supervisor
+from idle import IdlePolicy
+from profiler import Profiler
+import watchdog
+from teststrip import TestStripSchedule
+from program import ExposureProgram
+from fstops import StopTable, RESOLUTIONS, MIN_BASE
+from state import State
+import state
+import buttons
+from micropython import const
 from machine import Pin
-from machine import PWM
 import RGB1602
-import time
+
+boot_marks.append(("imports", time.ticks_us()))
 
 print("Starting up")
 
+SPLASH_MS = const(1000) # longest the welcome message stays up without input
+
+# custom characters 1 to 5 are progress bar cells with that many columns lit,
+# so the 16 cells of the bar have 80 steps
+BAR_STEPS = const(80)
+BAR_GLYPHS = [bytes([(0x1f << (5 - n)) & 0x1f] * 8) for n in range(1, 6)]
+
+# index of each button in self.buttons
+MODE_BTN = const(0)
+SET_BTN = const(1)
+FOCUS_BTN = const(2)
+RUN_BTN = const(3)
+
 
 class V21:
     
@@ -16,227 +56,312 @@ class V21:
         # We work like a state machine.
         # actions changes the state
         # changes in state are reflected in the display and lamp
-        self.state = {
-            "mode"  : "Burn", # the mode we are in: Expose | Burn | Test | Focus | Run
-            "mode_prev": None, # used to hold a previous state when we slip into Focus or Run
-            "run_duration" : 0, # total milliseconds for this exposure
-            "run_remaining" : 0, # time  milliseconds left of this exposure
-            "run_remaining_sec" : 0, # the time in seconds (used for triggering display update)
-            "run_start" : 0, # start milliseconds (ticks) time of this segment of exposure - resets if we pause
-            "base"  : 0.0,     # the basic exposure in seconds - defaults to a useful number
-            "stops" : 1.0,      # number of stops over or under the base we are set for a main exposure
-            "burn"  : 0.1,      # the number of stops over the base exposure that is set for the next burn
-            "steps" : 7,        # the number of steps in a test strip 
-            "interval" : 0.5,   # the size of a step in a test strip
-            "steps_mod": False, # whether we are changing the steps or interval
-            "step"  : 0,        # the step that we are currently on
-            "ref"   : 0.0,       # illumination value stored for comparison
-            "sample": 0.0       # current illumination value
-        }
+        self.state = State()
+        
+        # durations for each step of a test strip
+        self.strip = TestStripSchedule()
+        
+        # a main exposure and burns to run in one go
+        self.program = ExposureProgram()
         
         # we only update the display when the state has changed.
-        self.display_state = self.state.copy()
-        self.state["base"] = 16.0 # setting initial base here will trigger display update
-        self.state["mode"] = "Expose"
-        self.state["stops"] = 0.0
+        self.display_watch = self.state.watch()
+        self.state.base = 16.0 # the basic exposure defaults to a useful number
+        self.state.mode = "Expose"
+        self.state.stops = 0
         
-        # we need the LCD screen and it needs to be red
-        self.lcd=RGB1602.RGB1602(16,2)
-        self.lcd.setRGB(255,0,0);
+        # but what was set last time wins, and changes are saved as we go
+        self.settings = Settings(self.state)
         
-        # put up a welcome message for a couple of seconds
-        self.lcd.clear()
-        self.lcd.setCursor(0, 0)
-        self.lcd.printout("  V21 Enlarger  ")
-        self.lcd.setCursor(0,1)
-        self.lcd.printout("     Timer     ")
-        time.sleep(1)
+        # durations for every click of the stops, at the resolution set
+        self.stop_table = StopTable(self.state.resolution)
+        
+        # a lamp relay, off before anything else
+        self.lamp = Pin(27, Pin.OUT, Pin.PULL_DOWN)
+        self.lamp.value(0)
+        boot_mark("lamp")
         
         # we need a rotary encode to turn
-        self.encoder = RotaryIRQ(
+        self.encoder = Encoder(
             pin_num_clk=8,
             pin_num_dt=9,
             reverse=True,
             incr=1,
-            range_mode=RotaryIRQ.RANGE_BOUNDED,
+            range_mode=Encoder.RANGE_BOUNDED,
             pull_up=True,
             half_step=False,
-            min_val=-99,
-            max_val=99
+            min_val=-self.stop_table.limit,
+            max_val=self.stop_table.limit
         )
         self.encoder.reset() # set the value to start at 0
         self.encoder_old_value = self.encoder.value() # so we can see if it changes
         
-        # we need some buttons
-        self.debounce_time=0
-        self.mode_btn = Pin(10, Pin.IN, Pin.PULL_UP)
-        self.set_btn = Pin(1, Pin.IN, Pin.PULL_UP)
-        self.focus_btn = Pin(17, Pin.IN, Pin.PULL_UP)
-        self.run_btn = Pin(16, Pin.IN, Pin.PULL_UP)
+        # we need some buttons, in the order of the *_BTN indexes
+        self.buttons = buttons.Buttons((10, 1, 17, 16))
+        self.pressed = (self.mode_btn_pressed, self.set_btn_pressed, self.focus_btn_pressed, self.run_btn_pressed)
+        
+        # and commands over USB serial
+        self.remote = Remote(self)
+        boot_mark("input") # turns and presses are caught from here on
         
         # a buzzer to buzz with
-        self.buzzer = PWM(Pin(13, Pin.OUT), freq=200, duty_u16=32000)
-        self.buzzer.deinit() # silence it immediately
+        self.buzzer = Buzzer(13)
         
-        # a lamp relay
-        self.lamp = Pin(27, Pin.OUT, Pin.PULL_DOWN)
-        self.lamp.value(0)
+        # a photodiode for metering
+        self.sensor = LightSensor(26)
+        
+        # the exposure engine switches the lamp off on time
+        self.exposure_log = ExposureLog()
+        self.exposure = Exposure(self.lamp, self.exposure_log)
+        
+        # and the lamp goes off if the loop stops going round (see main())
+        self.watchdog = Supervisor(self.lamp)
+        self.watchdog.on_cut = self.exposure.pause # which stops timing there too
+        self.profiler = Profiler(self.state, self.watchdog) # off until started at the REPL
+        
+        # and the clock slows down when nobody is using it
+        self.idle = IdlePolicy(self)
+        self.lamp_version = -1 # state version the lamp last followed
+        
+        # no garbage collection while the lamp is on
+        self.heap = HeapGuard()
+        
+        # we need the LCD screen and it needs to be red
+        self.lcd=RGB1602.RGB1602(16,2)
+        self.lcd.setRGB(255,0,0);
+        for i in range(5):
+            self.lcd.createChar(1 + i, BAR_GLYPHS[i])
+        boot_mark("lcd")
+        
+        # Run mode lines are built in these rather than in new strings
+        self.run_top = bytearray(16)
+        self.run_bottom = bytearray(16)
+        
+        # put up a welcome message, it stays until the first input
+        # or SPLASH_MS but the loop is running underneath it
+        self.lcd.printat(0, 0, "  V21 Enlarger  ")
+        self.lcd.printat(0, 1, "     Timer     ")
+        self.splash_until = time.ticks_add(time.ticks_ms(), SPLASH_MS)
+        self.splash_version = self.state.version
+        boot_mark("splash")
         
 
     # called in the main loop
     def poll_encoder(self):
         val_new = self.encoder.value()
         if self.encoder_old_value != val_new:
-            if self.state["mode"] == "Burn":
-                self.state["burn"] = self.state["burn"] + ( (val_new - self.encoder_old_value)* 0.1 )
-                if self.state["burn"] < 0.1: self.state["burn"] = 0.1 # never below 0.1 
-                self.state["burn"] = round(self.state["burn"], 1)
-            elif self.state["mode"] == "Test" and self.state["step"] == 0:
-                if self.state["steps_mod"]:
+            if self.state.mode == "Burn" or self.state.mode == "Program":
+                burn = self.state.burn + val_new - self.encoder_old_value
+                self.state.burn = max(1, min(self.stop_table.limit, burn)) # never below one click
+            elif self.state.mode == "Test" and self.state.step == 0:
+                if self.state.steps_mod:
                     # we are changing the number of steps
                     if val_new > self.encoder_old_value:
                         # increasing number of steps
-                        self.state["steps"] = self.state["steps"] + 2
-                        if self.state["steps"] > 15: self.state["steps"] = 21
+                        self.state.steps = self.state.steps + 2
+                        if self.state.steps > 15: self.state.steps = 21
                     else:
                         # decreasing number of steps
-                        self.state["steps"] = self.state["steps"] - 2
-                        if self.state["steps"] < 3: self.state["steps"] = 3
+                        self.state.steps = self.state.steps - 2
+                        if self.state.steps < 3: self.state.steps = 3
                 else:
                     # we are changing the interval
-                    self.state["interval"] = self.state["interval"] + ( (val_new - self.encoder_old_value)* 0.1 )
-                    if self.state["interval"] < 0.1: self.state["interval"] = 0.1 # never below 0.1
-                    self.state["interval"] = round(self.state["interval"], 1)
+                    self.state.interval = self.state.interval + ( (val_new - self.encoder_old_value)* 0.1 )
+                    if self.state.interval < 0.1: self.state.interval = 0.1 # never below 0.1
+                    self.state.interval = round(self.state.interval, 1)
             else:
                 # just update the stops
-                self.state["stops"] = val_new * 0.1
+                self.state.stops = val_new
                 
             # save so we can check again
             self.encoder_old_value = val_new
 
     # all important function to calculate the EXPOSE value from
-    # the base and stops variables
+    # the base and stops variables, in microseconds
     def get_exposure_duration(self):
-        return self.state["base"] * pow(2, self.state["stops"])
+        self.stop_table.update(self.state.base)
+        return self.stop_table.duration_us(self.state.stops)
 
     # all important function to calculate the BURN value from
-    # the base and stops variables
+    # the base and stops variables, in microseconds
     def get_burn_duration(self):
-        return (self.state["base"] * pow(2, self.state["burn"])) - self.state["base"]
+        self.stop_table.update(self.state.base)
+        return self.stop_table.burn_us(self.state.burn)
+    
+    # the stops follow the encoder, so move them both together
+    def set_stops(self, clicks):
+        self.encoder.set(value=clicks)
+        self.encoder_old_value = clicks
+        self.state.stops = clicks
     
+    # change the clicks per stop, keeping what is set as near as it can be
+    def set_resolution(self, resolution):
+        table = self.stop_table
+        if resolution == table.resolution:
+            return
+        stops = table.convert(self.state.stops, resolution)
+        burn = table.convert(self.state.burn, resolution)
+        self.program.convert(table, resolution)
+        table.set_resolution(resolution)
+        self.encoder.set(min_val=-table.limit, max_val=table.limit)
+        self.set_stops(table.clamp(stops))
+        self.state.burn = max(1, min(table.limit, burn))
+        self.state.resolution = resolution
+        self.state.program = self.state.program + 1
+    
+    # the base the meter suggests: the ref was right at ref_base so
+    # scale that by how much dimmer (or brighter) this negative is.
+    # 0 if there is nothing to go on
+    def get_meter_duration(self):
+        if self.state.ref <= 0 or self.state.sample <= 0:
+            return 0
+        return self.state.ref_base * self.state.ref / self.state.sample
+    
+    # the test strip schedule is only rebuilt when its settings change
     def get_step_duration(self):
-        
-        # this is worked out heuristically
-        # a better mathmetician would do it differently
-        
-        target_exposures = list();
-        steps_either_side = (self.state['steps']-1) / 2
-        
-        # work from the right
-        for i in range(steps_either_side):            
-            stripe = (steps_either_side - i) * -1
-            stops_off = stripe  * self.state["interval"]
-            duration = self.state["base"] * pow(2, stops_off)
-            target_exposures.append(duration)
-            
-        # add the base exposure in the middle
-        target_exposures.append(self.state["base"])
-        
-        for i in range(steps_either_side):
-            stripe = i+1
-            stops_off = stripe * self.state["interval"]
-            duration = self.state["base"] * pow(2, stops_off)
-            target_exposures.append(duration)
-        
-        # now take them away so they are additive.
-        additional_exposures = list();
-        for i in range(len(target_exposures)):
-            duration = target_exposures[i]
-            duration = duration - sum(additional_exposures)    
-            additional_exposures.append(duration)
-            
-        return additional_exposures[self.state['step']]
+        self.strip.update(self.state.base, self.state.steps, self.state.interval)
+        return self.strip.duration(self.state.step)
 
 
     def mode_btn_pressed(self):
-        if self.state["mode"] == "Expose":
-            self.state["mode"] = "Burn"
-        elif self.state["mode"] == "Burn":
-            self.state["mode"] = "Test"
-        elif self.state["mode"] == "Test":
-            self.state["mode"] = "Expose"
+        if self.state.mode == "Expose":
+            self.state.mode = "Burn"
+        elif self.state.mode == "Burn":
+            self.state.mode = "Test"
+        elif self.state.mode == "Test":
+            self.state.mode = "Program"
+        elif self.state.mode == "Program":
+            self.state.mode = "Expose"
         else:
             pass # do nothing if we are in Focus, Run or Pause
 
 
     def set_btn_pressed(self):
-        if self.state["mode"] == "Expose":
-            self.state["base"] = self.get_exposure_duration() # the base becomes the calcuated duration
-            self.state["stops"] = 0.0 # and we are now at the base so zero the stops
-        elif self.state["mode"] == "Burn":
-            self.state["burn"] = 0.1 # convenience reset
-        elif self.state["mode"] == "Test" and self.state["step"] == 0:
+        if self.state.mode == "Expose":
+            # the base becomes the calcuated duration, never less than the display shows
+            self.state.base = max(MIN_BASE, self.get_exposure_duration() / 1000000)
+            self.set_stops(0) # and we are now at the base so zero the stops
+        elif self.state.mode == "Burn":
+            self.state.burn = 1 # convenience reset
+        elif self.state.mode == "Test" and self.state.step == 0:
             # toggle between changing the steps and step
-            self.state["steps_mod"] = not self.state["steps_mod"]
-        elif self.state["mode"] == "Test" and self.state["step"] > 0:
+            self.state.steps_mod = not self.state.steps_mod
+        elif self.state.mode == "Test" and self.state.step > 0:
             # once we are running a sequence then this button cancels 
-            self.state["step"] = 0
+            self.state.step = 0
+        elif self.state.mode == "Program":
+            # add a burn at the stops set, it will wait for the card to be moved
+            if self.program.add(self.state.burn):
+                self.state.program = self.state.program + 1
+        elif self.state.mode == "Meter" and self.state.sample > 0:
+            # this negative printed well at the current base, remember it
+            self.state.ref = self.state.sample
+            self.state.ref_base = self.state.base
+            self.buzzer.play(200, 32000, 100)
         else:
             pass # do nothing if we are in Run or Pause
 
 
     def focus_btn_pressed(self):
         
-        if self.state["mode"] == "Focus":
+        if self.state.mode == "Focus":
             # we are already focussing so turn it off
-            self.state["mode"] = self.state["mode_prev"]
-        elif self.state["mode"] == "Run" or self.state["mode"] == "Paused":
+            self.buzzer.stop()
+            self.state.mode = self.state.mode_prev
+        elif self.state.mode == "Meter":
+            # finished metering without taking the suggestion
+            self.state.mode = self.state.mode_prev
+        elif self.state.mode == "Run" or self.state.mode == "Paused":
             # we are running and this is the cancel button
-            self.state["mode"] = self.state["mode_prev"]
-            self.state["step"] = 0 # and cancel the current test sequence if any
-        elif self.state["mode"] == "Test" and self.state["step"] > 0:
-            self.state["step"] = 0
+            self.exposure.cancel()
+            self.heap.release()
+            if self.state.mode == "Run": self.beep_end()
+            self.state.mode = self.state.mode_prev
+            self.state.step = 0 # and cancel the current test sequence if any
+        elif self.state.mode == "Test" and self.state.step > 0:
+            self.state.step = 0
         else:
             # we are in some other mode and so switching over to focus
-            self.state["mode_prev"] = self.state["mode"]
-            self.state["mode"] = "Focus"
+            self.state.mode_prev = self.state.mode
+            self.state.mode = "Focus"
+            self.idle.wake() # PWM runs off the system clock
+            self.buzzer.metronome(200, int(65536*0.2), 100)
 
 
     def run_btn_pressed(self):
+        # full speed before the lamp goes on
+        self.idle.wake()
         
-        if self.state["mode"] == "Run":
+        if self.state.mode == "Run":
             # we are already running so pause
-            self.state["mode"] = "Paused"
-        elif self.state["mode"] == "Paused":
-            self.state["mode"] = "Run"
-            self.state["run_start"] = time.ticks_ms()
-        elif self.state["mode"] == "Expose":
+            self.exposure.pause()
+            self.heap.release()
+            self.beep_end()
+            self.state.mode = "Paused"
+        elif self.state.mode == "Paused":
+            self.state.mode = "Run"
+            self.heap.hold()
+            self.exposure.resume()
+            self.beep_seconds()
+        elif self.state.mode == "Expose":
             # making a regular exposure
-            self.state["mode"] = "Run"
-            self.state["mode_prev"] = "Expose" # so we can go back afterwards
-            self.state["run_start"] = time.ticks_ms()
-            self.state["run_duration"] = self.get_exposure_duration() * 1000
-            self.state["run_remaining"] = self.state["run_duration"]
-            self.state['run_remaining_sec'] = round(self.get_exposure_duration(), 1)
+            self.state.mode = "Run"
+            self.state.mode_prev = "Expose" # so we can go back afterwards
+            self.state.run_duration = self.get_exposure_duration()
+            self.state.run_remaining = self.state.run_duration
+            self.state.run_remaining_tenths = (self.state.run_duration + 50000) // 100000
+            self.heap.hold()
+            self.exposure.start(self.state.run_duration)
+            self.beep_seconds()
             
-        elif self.state["mode"] == "Burn":
+        elif self.state.mode == "Burn":
             # burning stops
-            self.state["mode"] = "Run"
-            self.state["mode_prev"] = "Burn" # so we can go back afterwards
-            self.state["run_start"] = time.ticks_ms()
-            self.state["run_duration"] = self.get_burn_duration() * 1000
-            self.state["run_remaining"] = self.state["run_duration"]
-            self.state['run_remaining_sec'] = round(self.get_burn_duration(), 1)
+            self.state.mode = "Run"
+            self.state.mode_prev = "Burn" # so we can go back afterwards
+            self.state.run_duration = self.get_burn_duration()
+            self.state.run_remaining = self.state.run_duration
+            self.state.run_remaining_tenths = (self.state.run_duration + 50000) // 100000
+            self.heap.hold()
+            self.exposure.start(self.state.run_duration)
+            self.beep_seconds()
             
-        elif self.state["mode"] == "Test":
+        elif self.state.mode == "Test":
             # run one of the test steps
-            self.state["mode"] = "Run"
-            self.state["mode_prev"] = "Test" # so we can go back afterwards
-            self.state["run_start"] = time.ticks_ms()
-            self.state["run_duration"] = self.get_step_duration() * 1000
-            self.state["run_remaining"] = self.state["run_duration"]
-            self.state['run_remaining_sec'] = round(self.get_step_duration(), 1)
-            self.state["step"] = self.state["step"] + 1
+            self.state.mode = "Run"
+            self.state.mode_prev = "Test" # so we can go back afterwards
+            self.state.run_duration = int(self.get_step_duration() * 1000000)
+            self.state.run_remaining = self.state.run_duration
+            self.state.run_remaining_tenths = (self.state.run_duration + 50000) // 100000
+            self.heap.hold()
+            self.exposure.start(self.state.run_duration)
+            self.beep_seconds()
+            self.state.step = self.state.step + 1
+
+        elif self.state.mode == "Program":
+            # the main exposure and then the burns
+            self.stop_table.update(self.state.base)
+            count = self.program.compile(self.stop_table, self.state.stops)
+            if not count:
+                # a segment is longer than the engine can time, or empty
+                self.buzzer.play(100, 32000, 400)
+                return
+            self.state.mode = "Run"
+            self.state.mode_prev = "Program" # so we can go back afterwards
+            self.state.segment = 0
+            self.state.run_duration = self.program.durations[0]
+            self.state.run_remaining = self.state.run_duration
+            self.state.run_remaining_tenths = (self.state.run_duration + 50000) // 100000
+            self.heap.hold()
+            self.exposure.start_program(self.program.durations, self.program.waits, count)
+            self.beep_seconds()
+
+        elif self.state.mode == "Meter":
+            # take the suggested base and go back
+            duration = self.get_meter_duration()
+            if duration > 0:
+                self.state.base = max(MIN_BASE, round(duration, 1))
+                self.set_stops(0)
+                self.state.mode = self.state.mode_prev
 
         else:
             pass # do nothing when in focus mode
@@ -247,27 +372,63 @@ class V21:
     # called in the main loop
     def poll_buttons(self):
         
-        if ((self.mode_btn.value() is 0) and (time.ticks_ms()-self.debounce_time) > 300):
-            self.debounce_time=time.ticks_ms()
-            self.mode_btn_pressed()
-        
-        if ((self.set_btn.value() is 0) and (time.ticks_ms()-self.debounce_time) > 300):
-            self.debounce_time=time.ticks_ms()
-            self.set_btn_pressed()
-
-        if ((self.focus_btn.value() is 0) and (time.ticks_ms()-self.debounce_time) > 300):
-            self.debounce_time=time.ticks_ms()
-            self.focus_btn_pressed()
-
-        if ((self.run_btn.value() is 0) and (time.ticks_ms()-self.debounce_time) > 300):
-            self.debounce_time=time.ticks_ms()
-            self.run_btn_pressed()
+        # the presses have been captured by IRQ, we just work through them
+        self.buttons.poll()
+        while self.buttons.pending():
+            btn, kind, ms = self.buttons.pop()
+            if kind == buttons.PRESS:
+                self.pressed[btn]()
+            elif kind == buttons.LONG:
+                self.button_long(btn)
+            elif kind == buttons.DOUBLE:
+                self.button_double(btn)
 
+    # called in the main loop
+    def poll_remote(self):
+        self.remote.poll()
+
+    def button_long(self, btn):
+        if btn == FOCUS_BTN and self.state.mode == "Focus":
+            # holding focus meters the light that is on the baseboard
+            self.buzzer.stop()
+            self.state.mode = "Meter"
+            self.sensor.restart()
+        elif btn == SET_BTN and self.state.mode == "Burn":
+            # holding set (which also reset the burn) steps through
+            # tenths, sixths and thirds of a stop
+            i = RESOLUTIONS.index(self.stop_table.resolution)
+            self.set_resolution(RESOLUTIONS[(i + 1) % len(RESOLUTIONS)])
+            self.idle.wake() # PWM runs off the system clock
+            self.buzzer.play(200, 32000, 100)
+        elif btn == SET_BTN and self.state.mode == "Program":
+            # holding set starts the program again
+            self.program.clear()
+            self.state.program = self.state.program + 1
+
+    def button_double(self, btn):
+        if btn == SET_BTN and self.state.mode == "Program":
+            # the two presses added two burns, a double press
+            # means one that runs straight on without waiting
+            self.program.remove_last()
+            self.program.run_on()
+            self.state.program = self.state.program + 1
+
+    # only while metering, so never during an exposure
     def poll_sensor(self):
-        pass
+        if self.state.mode != "Meter":
+            return
+        if self.sensor.poll():
+            self.state.sample = self.sensor.reading
 
 
     def update_display(self):
+        if self.draw_display():
+            # only the cells that changed go to the LCD
+            self.lcd.flush()
+
+    # bring the LCD's frame up to date with the state, no I2C in here.
+    # returns True if anything was drawn
+    def draw_display(self):
     
             
         #    Only update portion of display that has changed.
@@ -276,182 +437,376 @@ class V21:
         #    Top left (0,0) is max 10 digits
         #    Bottom left (0,1) is max 11 digits
 
+        # leave the welcome message up until there's input or it has had its time
+        if self.splash_version >= 0:
+            if self.state.version == self.splash_version and time.ticks_diff(self.splash_until, time.ticks_ms()) > 0:
+                return False
+            self.splash_version = -1
+        
         # do nothing if the state hasn't changed
-        if self.display_state == self.state:
-            return
+        changed = self.state.take(self.display_watch)
+        if not changed:
+            return False
         
-        # something has changes
+        # something has changed, a new mode means redrawing everything
+        if changed & state.MODE:
+            changed = state.ALL
         
-        if self.state["mode"] == "Expose":
+        if self.state.mode == "Expose":
             
             # title
-            self.lcd.setCursor(0, 0)
-            self.lcd.printout('Expose    ')
+            if changed & state.MODE:
+                self.lcd.draw(0, 0, 'Expose    ')
 
             # duration
-            duration = self.get_exposure_duration();
-            duration = round(duration, 1)
-            secs = f"{duration}s";
-            self.lcd.setCursor(10, 0)
-            self.lcd.printout(f"{secs: >6}")
+            if changed & (state.BASE | state.STOPS | state.RESOLUTION):
+                duration = self.get_exposure_duration();
+                duration = round(duration / 1000000, 1)
+                secs = f"{duration}s";
+                self.lcd.draw(10, 0, f"{secs: >6}")
             
             # base
-            base = self.state['base']
-            base = round(base, 1)
-            secs = f"{base}s";
-            self.lcd.setCursor(0, 1)
-            self.lcd.printout(f"{secs: <10}")
+            if changed & state.BASE:
+                base = self.state.base
+                base = round(base, 1)
+                secs = f"{base}s";
+                self.lcd.draw(0, 1, f"{secs: <10}")
             
             # stops
-            if self.state["stops"] > 0:           
-                stops = f"+{self.state["stops"]} " # + added for clarity
-            else:
-                stops = f"{self.state["stops"]} "
-            self.lcd.setCursor(10, 1)
-            self.lcd.printout(f"{stops: >6}")
+            if changed & (state.STOPS | state.RESOLUTION):
+                stops = self.stop_table.label(self.state.stops) + " " # with a + for clarity
+                self.lcd.draw(10, 1, f"{stops: >6}")
 
             
-        elif self.state["mode"] == "Burn":
+        elif self.state.mode == "Burn":
             
             # title
-            self.lcd.setCursor(0, 0)
-            self.lcd.printout('Burn      ')
+            if changed & (state.MODE | state.RESOLUTION):
+                self.lcd.draw(0, 0, f"{'Burn 1/' + str(self.state.resolution): <10}")
 
             # duration
-            duration = self.get_burn_duration();
-            duration = round(duration, 1)
-            secs = f"{duration}s";
-            self.lcd.setCursor(10, 0)
-            self.lcd.printout(f"{secs: >6}")
+            if changed & (state.BASE | state.BURN | state.RESOLUTION):
+                duration = self.get_burn_duration();
+                duration = round(duration / 1000000, 1)
+                secs = f"{duration}s";
+                self.lcd.draw(10, 0, f"{secs: >6}")
             
             # base
-            base = self.state['base']
-            base = round(base, 1)
-            secs = f"{base}s";
-            self.lcd.setCursor(0, 1)
-            self.lcd.printout(f"{secs: <10}")
+            if changed & state.BASE:
+                base = self.state.base
+                base = round(base, 1)
+                secs = f"{base}s";
+                self.lcd.draw(0, 1, f"{secs: <10}")
             
             # stops to burn - always positive
-            burn = f"+{self.state['burn']} "
-            self.lcd.setCursor(10, 1)
-            self.lcd.printout(f"{burn: >6}")
+            if changed & (state.BURN | state.RESOLUTION):
+                burn = self.stop_table.label(self.state.burn) + " "
+                self.lcd.draw(10, 1, f"{burn: >6}")
             
-        elif self.state["mode"] == "Test":
+        elif self.state.mode == "Test":
             
             # title
-            self.lcd.setCursor(0, 0)
-            self.lcd.printout('Test      ')
+            if changed & state.MODE:
+                self.lcd.draw(0, 0, 'Test      ')
             
             # duration
-            duration = self.get_step_duration();
-            duration = round(duration, 1)
-            secs = f"{duration}s";
-            self.lcd.setCursor(10, 0)
-            self.lcd.printout(f"{secs: >6}")
+            if changed & (state.BASE | state.STEPS | state.INTERVAL | state.STEP):
+                duration = self.get_step_duration();
+                duration = round(duration, 1)
+                secs = f"{duration}s";
+                self.lcd.draw(10, 0, f"{secs: >6}")
+            
+            # steps (where base would go) and interval share the line
+            if changed & (state.STEPS | state.INTERVAL | state.STEP | state.STEPS_MOD):
+                steps = self.state.steps
+                if self.state.steps_mod and self.state.step == 0: steps = f"{steps:} <-" # signify changeable 
+                self.lcd.draw(0, 1, f"{self.state.step}/{steps: <8}")
+                
+                interval = self.state.interval
+                interval = f"+{interval:} "
+                if not self.state.steps_mod and self.state.step == 0 : interval = f"-> {interval:}" # signify changeable
+                self.lcd.draw(8, 1, f"{interval: >8}")
+        
+        elif self.state.mode == "Program":
             
-            # steps (where base would go)
-            steps = self.state['steps']
-            if self.state["steps_mod"] and self.state["step"] == 0: steps = f"{steps:} <-" # signify changeable 
-            self.lcd.setCursor(0, 1)
-            self.lcd.printout(f"{self.state['step']}/{steps: <8}")
+            # title and number of segments
+            if changed & (state.MODE | state.PROGRAM):
+                self.lcd.draw(0, 0, f"{'Prog ' + str(len(self.program)): <10}")
             
-            interval = self.state["interval"]
-            interval = f"+{interval:} "
-            if not self.state["steps_mod"] and self.state["step"] == 0 : interval = f"-> {interval:}" # signify changeable
-            self.lcd.setCursor(8, 1)
-            self.lcd.printout(f"{interval: >8}")
+            # total time for the lot
+            if changed & (state.BASE | state.STOPS | state.PROGRAM):
+                self.stop_table.update(self.state.base)
+                if self.program.compile(self.stop_table, self.state.stops):
+                    secs = f"{round(self.program.total_us() / 1000000, 1)}s"
+                else:
+                    secs = "long" # too long to run
+                self.lcd.draw(10, 0, f"{secs: >6}")
+            
+            # the last burn added, > if it runs straight on
+            if changed & state.PROGRAM:
+                burns = self.program.burns
+                if burns:
+                    last = "last" + self.stop_table.label(self.program.stops[burns - 1])
+                    if not self.program.waits[burns]: last = last + ">"
+                else:
+                    last = "no burns"
+                self.lcd.draw(0, 1, f"{last: <10}")
+            
+            # stops for the next burn
+            if changed & (state.BURN | state.RESOLUTION):
+                burn = self.stop_table.label(self.state.burn) + " "
+                self.lcd.draw(10, 1, f"{burn: >6}")
         
-        elif self.state["mode"] == "Focus":
-            self.lcd.clear()
-            self.lcd.setCursor(0, 0)
-            self.lcd.printout('   - FOCUS -   ')
+        elif self.state.mode == "Focus":
+            if changed & state.MODE:
+                self.lcd.clearFrame()
+                self.lcd.draw(0, 0, '   - FOCUS -   ')
 
-        elif self.state["mode"] == "Run":
+        elif self.state.mode == "Meter":
+            
+            # title
+            if changed & state.MODE:
+                self.lcd.draw(0, 0, 'Meter     ')
+            
+            # suggested base
+            if changed & (state.REF | state.REF_BASE | state.SAMPLE):
+                duration = self.get_meter_duration()
+                if duration > 0:
+                    secs = f"{round(duration, 1)}s"
+                else:
+                    secs = "--"
+                self.lcd.draw(10, 0, f"{secs: >6}")
+            
+            # the reading now and the one for the reference
+            if changed & state.SAMPLE:
+                self.lcd.draw(0, 1, f"{self.state.sample: <8}")
+            if changed & state.REF:
+                ref = f"r{self.state.ref}" if self.state.ref > 0 else "no ref"
+                self.lcd.draw(8, 1, f"{ref: >8}")
+
+        elif self.state.mode == "Run":
             
             # we only update the display if there has
             # been a significant change in the time remaining
-            if self.display_state['run_remaining_sec'] != self.state['run_remaining_sec'] or self.display_state["mode"] != "Run":    
-                self.lcd.clear()
-                self.lcd.setCursor(5, 0)
-                self.lcd.printout(f"{self.state['run_remaining_sec']}s")
-
-                bars = round(16 * self.state['run_remaining'] / self.state['run_duration'])
-                bars = '=' * bars;
-                self.lcd.setCursor(0, 1)
-                self.lcd.printout(bars)
-
-        elif self.state["mode"] == "Paused":
-            self.lcd.clear()
-            self.lcd.setCursor(5, 0)
-            self.lcd.printout(f"{self.state['run_remaining_sec']}s")
-            self.lcd.setCursor(4,1)
-            self.lcd.printout("Paused")
+            # (nothing here may allocate, the garbage collector is off)
+            if changed & (state.RUN_REMAINING_TENTHS | state.MODE):
+                self.render_countdown()
+                self.lcd.draw(0, 0, self.run_top)
+                self.render_bar()
+                self.lcd.draw(0, 1, self.run_bottom)
+
+        elif self.state.mode == "Paused":
+            if changed & (state.RUN_REMAINING_TENTHS | state.MODE):
+                self.render_countdown()
+                self.lcd.draw(0, 0, self.run_top)
+                if self.exposure.waiting:
+                    self.lcd.draw(0, 1, "Move card & Run ")
+                else:
+                    self.lcd.draw(0, 1, "    Paused      ")
 
         else:
             pass
         
-        # keep a copy to see if it changes next tim
-        self.display_state = self.state.copy()
+        return True
          
 
+    # "     12.3s" into run_top without making any new objects
+    def render_countdown(self):
+        line = self.run_top
+        for i in range(16):
+            line[i] = 0x20
+        tenths = self.state.run_remaining_tenths
+        secs = tenths // 10
+        digits = 1
+        t = secs
+        while t >= 10:
+            t //= 10
+            digits += 1
+        point = min(5 + digits, 13)
+        i = point - 1
+        while i >= 0:
+            line[i] = 0x30 + secs % 10 # '0'
+            secs //= 10
+            i -= 1
+            if secs == 0:
+                break
+        line[point] = 0x2e # '.'
+        line[point + 1] = 0x30 + tenths % 10
+        line[point + 2] = 0x73 # 's'
+
+    # the progress bar into run_bottom, likewise. Each cell is five
+    # steps wide so a tick usually changes only the cell at the end
+    def render_bar(self):
+        line = self.run_bottom
+        total = self.state.run_duration // 1000 # ms keeps the sums small ints
+        steps = 0
+        if total > 0:
+            steps = (BAR_STEPS * (self.state.run_remaining // 1000) + total // 2) // total
+        full = steps // 5
+        for i in range(16):
+            if i < full:
+                line[i] = 5 # all five columns
+            elif i == full and steps % 5:
+                line[i] = steps % 5
+            else:
+                line[i] = 0x20
+
+    # one time round the main loop
+    def tick(self):
+        wd = self.watchdog
+        wd.feed()
+        if wd.tripped: self.lamp_cut()
+        self.poll_encoder()
+        wd.stage(watchdog.BUTTONS)
+        self.poll_buttons()
+        wd.stage(watchdog.REMOTE)
+        self.poll_remote()
+        wd.stage(watchdog.SENSOR)
+        self.poll_sensor()
+        wd.stage(watchdog.DISPLAY)
+        self.update_display()
+        wd.stage(watchdog.TIMER)
+        self.update_timer()
+        wd.stage(watchdog.LAMP)
+        self.update_lamp()
+        wd.stage(watchdog.SETTINGS)
+        self.update_settings()
+        wd.stage(watchdog.IDLE)
+        self.idle.poll()
+
+    # the supervisor switched the lamp off while the loop was stuck
+    def lamp_cut(self):
+        self.watchdog.tripped = False
+        # the supervisor has already paused the engine from when the lamp
+        # really went off, so nothing is lost (a no-op if it has)
+        self.exposure.pause(self.watchdog.cut_us)
+        if self.state.mode == "Run" and not self.exposure.finished and not self.exposure.waiting:
+            self.state.run_remaining = self.exposure.remaining
+            self.state.run_remaining_tenths = (self.exposure.remaining + 50000) // 100000
+            self.heap.release()
+            self.beep_end()
+            self.state.mode = "Paused"
+        elif self.state.mode == "Focus" or self.state.mode == "Meter":
+            self.buzzer.stop()
+            self.state.mode = self.state.mode_prev
+
+    # tick on every whole second left of the exposure
+    def beep_seconds(self):
+        self.buzzer.countdown(self.exposure.remaining_us() // 1000, 200, 32000, 100)
+
+    # a long beep when the lamp goes off
+    def beep_end(self):
+        self.buzzer.stop()
+        self.buzzer.play(150, int(65536*0.2), 500)
+
     def update_lamp(self):
         
-        if self.state["mode"] == "Run":
-            # lamp on
-            self.lamp.value(1)
-            if self.state["run_remaining_sec"] % 1 == 0 :
-                self.buzzer.init(freq=200, duty_u16=32000)
-            else:
-                self.buzzer.deinit()
-        elif self.state["mode"] == "Focus":
+        # nothing to do unless the state has moved on
+        if self.state.version == self.lamp_version:
+            return
+        self.lamp_version = self.state.version
+        
+        if self.state.mode == "Run":
+            # the lamp is switched by the exposure engine
+            pass
+        elif self.state.mode == "Focus" or self.state.mode == "Meter":
             self.lamp.value(1)
-            if time.ticks_ms() / 1000 % 1 < 0.1:
-                self.buzzer.init(freq=200, duty_u16=int(65536*0.2))
-            else:
-                self.buzzer.deinit()
         else:
             self.lamp.value(0)
-            
-            # if we were previously in a run state then we
-            # do a long been
-            if self.display_state["mode"] == "Run":
-                print("was run")
-                self.buzzer.init(freq=150, duty_u16=int(65536*0.2))
-                time.sleep(0.5)
-            
-            # always stop the buzzer
-            self.buzzer.deinit()    
+
+    # saved in the background, but never with the lamp on
+    def update_settings(self):
+        self.settings.poll(self.lamp.value() == 1 or self.exposure.running)
 
     def update_timer(self):
-        if self.state["mode"] == "Run":
-            
-            now = time.ticks_ms()
-            remaining = self.state['run_remaining'] - time.ticks_diff(now, self.state["run_start"])
+        if self.state.mode == "Run":
             
-            if remaining <= 0:
-                self.state["mode"] = self.state["mode_prev"]
-                if self.state["mode"] == "Test" and self.state["step"] == self.state["steps"]:
-                    self.state["step"] = 0
-                    self.buzzer.deinit()
+            # the lamp has already been switched off by the
+            # exposure engine, we just catch up with it here
+            if self.exposure.finished:
+                self.exposure.finished = False
+                self.heap.release()
+                self.exposure_log.finish()
+                self.beep_end()
+                self.state.mode = self.state.mode_prev
+                if self.state.mode == "Test" and self.state.step == self.state.steps:
+                    self.state.step = 0
+            elif self.exposure.count > 1 and self.exposure.segment != self.state.segment:
+                # a program has moved on to its next segment
+                self.state.segment = self.exposure.segment
+                self.state.run_duration = self.program.durations[self.state.segment]
+                if self.exposure.waiting:
+                    # the lamp is off until the card is moved and Run pressed
+                    self.heap.release()
+                    self.beep_end()
+                    self.state.run_remaining = self.state.run_duration
+                    self.state.run_remaining_tenths = (self.state.run_duration + 50000) // 100000
+                    self.state.mode = "Paused"
+                else:
+                    self.beep_seconds()
             else:
-                self.state['run_remaining'] = remaining
-                self.state['run_remaining_sec'] = round(remaining / 1000, 1)
-                self.state["run_start"] = now
+                # only touch the state when the display would change,
+                # working in whole tenths so there are no floats
+                remaining = self.exposure.remaining_us()
+                tenths = (remaining + 50000) // 100000
+                if tenths != self.state.run_remaining_tenths:
+                    self.state.run_remaining = remaining
+                    self.state.run_remaining_tenths = tenths
+                    self.heap.check()
                 
                 
 
     
-# Do the business
-v21_timer = V21()
-
-# The main loop of the programme
-while(True):
-    v21_timer.poll_encoder()
-    v21_timer.poll_buttons()
-    v21_timer.poll_sensor()
-    v21_timer.update_display()
-    v21_timer.update_timer()
-    v21_timer.update_lamp()
-    
-    
-    
+# Set True to run as asyncio tasks (see runtime.py) rather than spinning
+USE_ASYNCIO = False
+
+# Set True to hand the LCD to the second core (see dualcore.py)
+USE_DUAL_CORE = False
+
+# Set False when developing, the hardware watchdog can't be stopped
+# and will reset the Pico a few seconds after Ctrl-C. With it on, the
+# reports are read with "wd", "heap" and "idle" over serial (see remote.py)
+USE_WDT = True
+
+
+def boot_mark(what):
+    boot_marks.append((what, time.ticks_us()))
+
+# print how long each stage of starting up took
+def boot_timeline():
+    last = 0
+    for what, at in boot_marks:
+        print("boot", what, at, "us", "+" + str(time.ticks_diff(at, last)))
+        last = at
+
+
+def main():
+    global v21_timer
+
+    # Do the business
+    v21_timer = V21()
+    boot_mark("ready")
+    boot_timeline()
+    v21_timer.watchdog.start(wdt=USE_WDT)
+
+    if USE_ASYNCIO:
+        import runtime
+        runtime.run(v21_timer)
+
+    if USE_DUAL_CORE:
+        import dualcore
+        dualcore.run(v21_timer)
+
+    # The main loop of the programme
+    while(True):
+        try:
+            v21_timer.tick()
+        except OSError as e:
+            # most likely the LCD's I2C, keep going without it
+            v21_timer.watchdog.error(e)
+
+
+# Only start when run on the Pico, so V21 can be imported (e.g. by ../sim)
+# or built into bytecode and started from a stub (see ../tools/build_mpy.py)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# Main loop profiler
+#
+# Where does the loop's time go on a real unit? The supervisor already
+# times every part of every iteration (see watchdog.py); when a profiler
+# is started it hands each of those times over as well, and the profiler
+# adds them to a histogram for the part and the mode the timer is in. The
+# histograms are powers of two of microseconds in preallocated arrays, so
+# nothing is allocated in the loop, and nothing at all until start(). While
+# stopped the only cost is the supervisor checking for a profiler once per
+# part, so it can stay in on production units:
+#
+# The loop doesn't run while the REPL has it, and with the hardware
+# watchdog on the Pico resets, so it is driven over serial while the timer
+# is in use (see remote.py):
+#
+#   prof on
+#   ... use the timer ...
+#   prof report                         # or prof report Run
+#   prof off
+#
+# It only sees the spin loop at the bottom of main.py, the other runtimes
+# don't mark the parts of an iteration.
+
+from micropython import const
+from array import array
+import watchdog
+
+BUCKETS = const(12) # under 16us, under 32us, ... 16384us and over
+FIRST = const(4) # the first bucket is under 2^FIRST
+
+MODES = ("Expose", "Burn", "Test", "Program", "Focus", "Meter", "Run", "Paused")
+PARTS = watchdog.STAGES + ("loop",) # the parts and then whole iterations
+LOOP = len(watchdog.STAGES)
+
+
+class Profiler:
+
+    def __init__(self, timer_state, supervisor):
+        self.state = timer_state
+        self.supervisor = supervisor
+        self.mode = 0 # index into MODES for this iteration
+        self.counts = None # built by start()
+
+    def start(self):
+        if self.counts is None:
+            rows = len(MODES) * len(PARTS)
+            self.counts = array('L', [0] * (rows * BUCKETS))
+            self.max_us = array('l', [0] * rows)
+            self.total_us = array('l', [0] * rows) # under a second, the rest is in total_s
+            self.total_s = array('l', [0] * rows)
+        self.iteration()
+        self.supervisor.profiler = self
+
+    def stop(self):
+        self.supervisor.profiler = None
+
+    def reset(self):
+        if self.counts is None:
+            return
+        for a in (self.counts, self.max_us, self.total_us, self.total_s):
+            for i in range(len(a)):
+                a[i] = 0
+
+    # from the supervisor as an iteration starts
+    def iteration(self):
+        mode = self.state.mode
+        for i in range(len(MODES)):
+            if MODES[i] == mode:
+                self.mode = i
+                return
+
+    # from the supervisor, us for the whole of the last iteration
+    def loop(self, us):
+        self.add(LOOP, us)
+        self.iteration()
+
+    # from the supervisor, us spent in a part
+    def add(self, part, us):
+        row = self.mode * len(PARTS) + part
+        if us > self.max_us[row]:
+            self.max_us[row] = us
+        total = self.total_us[row] + us
+        if total >= 1000000:
+            self.total_s[row] += total // 1000000
+            total %= 1000000
+        self.total_us[row] = total
+        bucket = 0
+        us >>= FIRST
+        while us and bucket < BUCKETS - 1:
+            us >>= 1
+            bucket += 1
+        self.counts[row * BUCKETS + bucket] += 1
+
+    # only for one of MODES, to the REPL or out
+    def report(self, only=None, out=None):
+        if self.counts is None:
+            print("not started", file=out)
+            return
+        print("%-9s %8s %8s %8s  %s" % ("part", "count", "mean us", "max us",
+                                        "histogram: under 16us, 32us ... 16ms and over"), file=out)
+        for m in range(len(MODES)):
+            if only is not None and MODES[m] != only:
+                continue
+            first = True
+            for p in range(len(PARTS)):
+                row = m * len(PARTS) + p
+                at = row * BUCKETS
+                count = sum(self.counts[at:at + BUCKETS])
+                if not count:
+                    continue
+                if first:
+                    print(MODES[m], file=out)
+                    first = False
+                total = self.total_s[row] * 1000000 + self.total_us[row]
+                print("%-9s %8d %8d %8d  %s" % (PARTS[p], count, total // count, self.max_us[row],
+                                                " ".join(str(c) for c in self.counts[at:at + BUCKETS])), file=out)
@@ -0,0 +1,80 @@
+# Exposure programs
+#
+# A main exposure followed by a number of burns, each a number of stops
+# over the base like in Burn mode, run one after the other from a single
+# press of Run. Before each burn the timer can wait, lamp off, for the card
+# to be moved (press Run to carry on) or go straight on with the lamp still
+# on and the next deadline taken from the end of the last, so nothing is
+# lost between segments.
+#
+# The program is compiled into an array of microsecond durations when it
+# is run and the exposure engine works through that (see exposure.py).
+# Burns are kept in clicks of the stop table, so that is just lookups
+# (see fstops.py).
+
+from micropython import const
+from array import array
+
+MAX_BURNS = const(8)
+MAX_SEGMENT_US = const(0x7fffffff) # about 35 minutes, all a 32 bit array holds
+
+
+class ExposureProgram:
+
+    def __init__(self):
+        self.burns = 0
+        self.stops = array('h', [0] * MAX_BURNS) # clicks over the base for each burn
+        self.waits = bytearray(MAX_BURNS + 1) # 1 to wait before segment i (the main exposure never does)
+        self.durations = array('l', [0] * (MAX_BURNS + 1)) # compiled, microseconds
+
+    # segments including the main exposure
+    def __len__(self):
+        return self.burns + 1
+
+    # add a burn to the end, False if there is no room
+    def add(self, stops, wait=True):
+        if self.burns == MAX_BURNS:
+            return False
+        self.stops[self.burns] = stops
+        self.burns += 1
+        self.waits[self.burns] = 1 if wait else 0
+        return True
+
+    def remove_last(self):
+        if self.burns:
+            self.burns -= 1
+
+    # the last burn follows straight on rather than waiting
+    def run_on(self):
+        if self.burns:
+            self.waits[self.burns] = 0
+
+    def clear(self):
+        self.burns = 0
+
+    # the stop table is about to change resolution, keep the burns near
+    def convert(self, table, resolution):
+        for i in range(self.burns):
+            self.stops[i] = max(1, table.convert(self.stops[i], resolution))
+
+    # work out the duration of every segment from a table that is up to
+    # date with the base, returns how many there are or 0 if one of them
+    # is too long to run or has nothing to run
+    def compile(self, table, stops):
+        us = table.duration_us(stops)
+        if us <= 0 or us > MAX_SEGMENT_US:
+            return 0
+        self.durations[0] = us
+        for i in range(self.burns):
+            us = table.burn_us(self.stops[i])
+            if us <= 0 or us > MAX_SEGMENT_US:
+                return 0
+            self.durations[i + 1] = us
+        return self.burns + 1
+
+    # total microseconds once compiled
+    def total_us(self):
+        total = 0
+        for i in range(self.burns + 1):
+            total += self.durations[i]
+        return total
@@ -0,0 +1,288 @@
+# Remote control over USB serial
+#
+# Lines of text on the USB serial port (the same one as the REPL) drive the
+# timer from a computer, so test sequences can be scripted and telemetry
+# collected. Every command ends with one line back, "ok ..." or "err ...",
+# the reports come before it.
+#
+#   base 16.5       stops -0.3      burn 0.5       steps 9      interval 0.2
+#   res 10|6|3      mode Test       run            pause        cancel
+#   state           stream on|off   log            help
+#   wd              heap            idle           prof on|off|report [mode]
+#
+# Stops and burns are given in stops and go to the nearest click at the
+# resolution set, state reports them in clicks.
+#
+# run, pause and cancel do what the Run and Focus buttons would. With stream
+# on, changed fields are sent as "ev name=value" lines at most every
+# STREAM_MS, and a line per exposure with its accuracy. run_remaining is
+# left out, run_remaining_tenths says the same often enough. The stream
+# goes on during exposures, when the heap guard has collection off, so
+# whole number values are written out of a preallocated buffer and only
+# the fields that can't change while the lamp is on (the floats) make new
+# strings. log, wd, heap and idle print the exposure log's, supervisor's,
+# heap guard's and idle policy's reports, which is
+# the only way to see them once the hardware watchdog is on: stopping the
+# program for the REPL resets the Pico. prof starts and stops the loop
+# profiler and prints its histograms (see profiler.py).
+#
+# poll() is called from the main loop and uses select.poll with no timeout,
+# so it only reads what has already arrived and never waits. Ctrl-C still
+# stops the program as usual.
+
+from micropython import const
+from fstops import RESOLUTIONS, MIN_BASE, MAX_BASE
+from profiler import MODES as profiler_modes
+import select
+import state
+import sys
+import time
+
+INPUT = sys.stdin
+OUTPUT = sys.stdout
+
+LINE_MAX = const(64)
+READ_MAX = const(32) # characters read per poll, so a flood can't hold up the loop
+STREAM_MS = const(100)
+STREAMED = state.ALL & ~state.RUN_REMAINING
+
+MODES = ("Expose", "Burn", "Test", "Program")
+
+
+class Remote:
+
+    def __init__(self, v21, inp=None, out=None):
+        self.v21 = v21
+        self.inp = inp if inp is not None else INPUT
+        self.out = out if out is not None else OUTPUT
+        self.poller = select.poll()
+        self.poller.register(self.inp, select.POLLIN)
+        self.line = bytearray(LINE_MAX)
+        self.length = 0
+        self.overflow = False # the line was too long, ignore it
+        self.streaming = False
+        self.watcher = v21.state.watch()
+        self.stream_due = time.ticks_ms()
+        self.commands = 0
+        # (name, bit, "ev name=") for each streamed field and a line to build in
+        self.fields = tuple((name, bit, ("ev " + name + "=").encode())
+                            for name, bit in state.BITS.items() if bit & STREAMED)
+        self.buffer = bytearray(LINE_MAX)
+
+    # anything waiting? ipoll, unlike poll, doesn't make a new list
+    def _ready(self):
+        for _ in self.poller.ipoll(0):
+            return True
+        return False
+
+    # from the main loop
+    def poll(self):
+        n = 0
+        while n < READ_MAX and self._ready():
+            c = self.inp.read(1)
+            if not c:
+                break
+            n += 1
+            c = ord(c)
+            if c == 10 or c == 13: # end of line
+                if self.length and not self.overflow:
+                    self.command(bytes(self.line[:self.length]).decode())
+                elif self.overflow:
+                    self.reply("err too long")
+                self.length = 0
+                self.overflow = False
+            elif self.length < LINE_MAX:
+                self.line[self.length] = c
+                self.length += 1
+            else:
+                self.overflow = True
+        if self.streaming:
+            self.stream()
+
+    def reply(self, text):
+        self.out.write(text)
+        self.out.write("\n")
+
+    def command(self, line):
+        words = line.split()
+        if not words:
+            return
+        self.commands += 1
+        name = words[0]
+        arg = " ".join(words[1:]) if len(words) > 1 else None
+        try:
+            handler = getattr(self, "do_" + name)
+        except AttributeError:
+            self.reply("err unknown " + name)
+            return
+        try:
+            result = handler(arg)
+        except (ValueError, TypeError, OverflowError):
+            self.reply("err bad value")
+            return
+        if result is None:
+            self.reply("ok")
+        elif result.startswith("err"):
+            self.reply(result)
+        else:
+            self.reply("ok " + result)
+
+    # ---- settings, not while an exposure or test strip is under way
+
+    def _idle(self):
+        return self.v21.state.mode in MODES
+
+    # and not part way through a test strip, its schedule must stay put
+    def _settable(self):
+        return self._idle() and self.v21.state.step == 0
+
+    def do_base(self, arg):
+        if not self._settable(): return "err busy"
+        base = round(float(arg), 1)
+        if not MIN_BASE <= base <= MAX_BASE: return "err range" # nan too
+        self.v21.state.base = base
+
+    def do_stops(self, arg):
+        if not self._settable(): return "err busy"
+        table = self.v21.stop_table
+        clicks = int(round(float(arg) * table.resolution))
+        if clicks < -table.limit or clicks > table.limit: return "err range"
+        self.v21.set_stops(clicks)
+
+    def do_burn(self, arg):
+        if not self._settable(): return "err busy"
+        table = self.v21.stop_table
+        clicks = int(round(float(arg) * table.resolution))
+        if clicks < 1 or clicks > table.limit: return "err range"
+        self.v21.state.burn = clicks
+
+    def do_res(self, arg):
+        if not self._settable(): return "err busy"
+        if int(arg) not in RESOLUTIONS: return "err range"
+        self.v21.set_resolution(int(arg))
+
+    def do_steps(self, arg):
+        if not self._settable(): return "err busy"
+        steps = int(arg)
+        if steps < 3 or steps > 21 or steps % 2 == 0: return "err range"
+        self.v21.state.steps = steps
+
+    def do_interval(self, arg):
+        if not self._settable(): return "err busy"
+        interval = round(float(arg), 1)
+        if not 0.1 <= interval <= MAX_BASE: return "err range" # nan too
+        self.v21.state.interval = interval
+
+    def do_mode(self, arg):
+        if not self._idle(): return "err busy"
+        if arg not in MODES: return "err range"
+        self.v21.state.mode = arg
+
+    # ---- runs, as the buttons would
+
+    def do_run(self, arg):
+        mode = self.v21.state.mode
+        if mode != "Paused" and not self._idle(): return "err busy"
+        self.v21.run_btn_pressed()
+        if self.v21.state.mode != "Run": return "err not started" # a program too long to run
+        return str(self.v21.state.run_duration)
+
+    def do_pause(self, arg):
+        if self.v21.state.mode != "Run": return "err not running"
+        self.v21.run_btn_pressed()
+
+    def do_cancel(self, arg):
+        mode = self.v21.state.mode
+        if mode != "Run" and mode != "Paused": return "err not running"
+        self.v21.focus_btn_pressed()
+
+    # ---- telemetry
+
+    def do_state(self, arg):
+        s = self.v21.state
+        return " ".join(name + "=" + str(getattr(s, name)) for name in state.BITS)
+
+    def do_stream(self, arg):
+        if arg != "on" and arg != "off": return "err on or off"
+        self.streaming = arg == "on"
+        self.v21.exposure_log.verbose = self.streaming
+        self.v21.state.take(self.watcher) # only changes from now on
+
+    def do_log(self, arg):
+        self.v21.exposure_log.report(self.out)
+
+    def do_wd(self, arg):
+        self.v21.watchdog.report(self.out)
+
+    def do_heap(self, arg):
+        self.v21.heap.report(self.out)
+
+    def do_idle(self, arg):
+        self.v21.idle.report(self.out)
+
+    def do_prof(self, arg):
+        words = arg.split() if arg else ()
+        profiler = self.v21.profiler
+        if not words:
+            return "err on, off or report"
+        if words[0] == "on":
+            profiler.start()
+        elif words[0] == "off":
+            profiler.stop()
+        elif words[0] == "report":
+            if profiler.counts is None: return "err not started"
+            only = words[1] if len(words) > 1 else None
+            if only is not None and only not in profiler_modes: return "err range"
+            profiler.report(only, self.out)
+        else:
+            return "err on, off or report"
+
+    def do_help(self, arg):
+        return "base stops burn res steps interval mode run pause cancel state stream log wd heap idle prof"
+
+    # changed fields, not too often
+    def stream(self):
+        now = time.ticks_ms()
+        if time.ticks_diff(self.stream_due, now) > 0:
+            return
+        changed = self.v21.state.take(self.watcher)
+        if not changed:
+            return
+        changed &= STREAMED
+        if not changed:
+            return
+        self.stream_due = time.ticks_add(now, STREAM_MS)
+        s = self.v21.state
+        for name, bit, prefix in self.fields:
+            if changed & bit:
+                self._event(prefix, getattr(s, name))
+
+    # one "ev name=value" line
+    def _event(self, prefix, value):
+        buffer = self.buffer
+        n = len(prefix)
+        for i in range(n):
+            buffer[i] = prefix[i]
+        if value is True or value is False or value is None or not isinstance(value, int):
+            # strings are written as they are, the rest aren't streamed in Run
+            self.out.write(buffer, n)
+            self.reply(value if isinstance(value, str) else str(value))
+            return
+        # a whole number, digits backwards from the end of the buffer then moved up
+        if value < 0:
+            buffer[n] = 45 # -
+            n += 1
+            value = -value
+        end = len(buffer)
+        at = end
+        while True:
+            at -= 1
+            buffer[at] = 48 + value % 10
+            value //= 10
+            if not value:
+                break
+        for i in range(at, end):
+            buffer[n] = buffer[i]
+            n += 1
+        buffer[n] = 10 # newline
+        self.out.write(buffer, n + 1)
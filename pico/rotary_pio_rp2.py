@@ -0,0 +1,150 @@
+# Rotary encoder decoded by a PIO state machine
+#
+# A drop in replacement for RotaryIRQ. Instead of a Python interrupt on
+# every edge of both pins, a state machine samples CLK and DT continuously
+# and keeps a count in its X register, so edges can't be missed however
+# busy the CPU is and no CPU time is spent until value() is asked for.
+#
+# The program is the usual quadrature jump table: the previous and current
+# pin levels make a 4 bit index into the first 16 instructions, each of
+# which jumps to increment, decrement or just sample again. Every edge
+# counts (four per detent) and a bounce counts one way and straight back.
+# The table is jumped to with an absolute `mov(pc, isr)` so the program has
+# to sit at offset 0; it is padded to fill all 32 instructions of its PIO
+# block, which is then the only place it will fit.
+#
+# The count is pushed to the RX FIFO every time round. value() empties the
+# FIFO and waits for a fresh one, works out how many whole detents have
+# passed since it last looked and applies them with the same increment,
+# direction and range rules as Rotary. Listeners are called from value()
+# rather than from an interrupt.
+#
+# CLK and DT must be consecutive pins with DT the higher.
+
+from machine import Pin
+from micropython import const
+from rotary import Rotary, _bound, _wrap, _trigger
+import rp2
+
+_ORIGIN = const(0x10000000) # X starts here so the count stays a small positive int
+_FREQ = const(1000000) # about 7us per sample
+
+
+@rp2.asm_pio(in_shiftdir=rp2.PIO.SHIFT_LEFT, out_shiftdir=rp2.PIO.SHIFT_RIGHT)
+def _quadrature():
+    # index is previous DT, CLK then current DT, CLK
+    jmp("update")       # 00 00
+    jmp("decrement")    # 00 01
+    jmp("increment")    # 00 10
+    jmp("update")       # 00 11 skipped a state, ignore it
+    jmp("increment")    # 01 00
+    jmp("update")       # 01 01
+    jmp("update")       # 01 10 skipped
+    jmp("decrement")    # 01 11
+    jmp("decrement")    # 10 00
+    jmp("update")       # 10 01 skipped
+    jmp("update")       # 10 10
+    jmp("increment")    # 10 11
+    jmp("update")       # 11 00 skipped
+    jmp("increment")    # 11 01
+    jmp("decrement")    # 11 10
+    jmp("update")       # 11 11
+    label("decrement")
+    jmp(x_dec, "update")
+    wrap_target()
+    label("update")
+    mov(isr, x)
+    push(noblock)
+    out(isr, 2)         # previous pins back into the ISR
+    in_(pins, 2)        # and the current ones after them
+    mov(osr, isr)       # kept for next time
+    mov(pc, isr)        # into the table
+    label("increment")  # there is no x++, so x = ~(~x - 1)
+    mov(x, invert(x))
+    jmp(x_dec, "increment_done")
+    label("increment_done")
+    mov(x, invert(x))
+    wrap()
+    # padding, see above
+    nop()
+    nop()
+    nop()
+    nop()
+    nop()
+    nop()
+
+
+class RotaryPIO(Rotary):
+
+    def __init__(
+        self,
+        pin_num_clk,
+        pin_num_dt,
+        min_val=0,
+        max_val=10,
+        incr=1,
+        reverse=False,
+        range_mode=Rotary.RANGE_UNBOUNDED,
+        pull_up=False,
+        half_step=False,
+        invert=False,
+        sm_id=4
+    ):
+        # invert makes no difference here, every edge is counted either way
+        super().__init__(min_val, max_val, incr, reverse, range_mode, half_step, invert)
+
+        if pin_num_dt != pin_num_clk + 1:
+            raise ValueError("DT must be the pin after CLK")
+        pull = Pin.PULL_UP if pull_up else None
+        self._pin_clk = Pin(pin_num_clk, Pin.IN, pull)
+        self._pin_dt = Pin(pin_num_dt, Pin.IN, pull)
+        self._per_step = 2 if half_step else 4
+
+        self._sm = rp2.StateMachine(sm_id, _quadrature, freq=_FREQ, in_base=self._pin_clk)
+        self._sm.put(_ORIGIN)
+        self._sm.exec("pull()")
+        self._sm.exec("mov(x, osr)")
+        self._sm.exec("mov(osr, null)")
+        self._sm.active(1)
+        self._raw = self._read()
+
+    # the latest count from the state machine
+    def _read(self):
+        sm = self._sm
+        n = sm.rx_fifo() + 1 # all the stale ones and then a fresh one
+        while n:
+            raw = sm.get()
+            n -= 1
+        return raw
+
+    def value(self):
+        counts = self._read() - self._raw
+        # whole detents only, a part turn either way stays pending
+        if counts >= 0:
+            steps = counts // self._per_step
+        else:
+            steps = -((-counts) // self._per_step)
+        if steps:
+            self._raw += steps * self._per_step
+            old_value = self._value
+            incr = steps * self._incr * self._reverse
+            if self._range_mode == self.RANGE_WRAP:
+                self._value = _wrap(self._value, incr, self._min_val, self._max_val)
+            elif self._range_mode == self.RANGE_BOUNDED:
+                self._value = _bound(self._value, incr, self._min_val, self._max_val)
+            else:
+                self._value = self._value + incr
+            if old_value != self._value and len(self._listener) != 0:
+                _trigger(self)
+        return self._value
+
+    # Rotary.set() brackets its changes with these. Nothing needs
+    # disabling but a part turn from before the change is dropped
+    def _hal_disable_irq(self):
+        pass
+
+    def _hal_enable_irq(self):
+        self._raw = self._read()
+
+    def _hal_close(self):
+        self._sm.active(0)
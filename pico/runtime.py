@@ -0,0 +1,92 @@
+# Cooperative runtime
+#
+# An alternative to the spin loop at the bottom of main.py. Each part of
+# the timer is an asyncio task that sleeps until something happens:
+#   timing  - woken by the exposure engine or a mode change, 10Hz in Run
+#   input   - woken by the encoder or a button, 50Hz for long presses
+#   display - woken when there is something to draw, at most 20Hz
+# asyncio has no priorities so the display task deals with any pending
+# timing work itself before it starts a (slow) I2C redraw.
+
+from micropython import const
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+INPUT_POLL_MS = const(20)
+RUN_TICK_MS = const(100)
+DISPLAY_MIN_MS = const(50)
+
+
+class Runtime:
+
+    def __init__(self, v21):
+        self.v21 = v21
+        self.timing_flag = asyncio.ThreadSafeFlag()
+        self.input_flag = asyncio.ThreadSafeFlag()
+        self.display_flag = asyncio.ThreadSafeFlag()
+
+        # hardware events wake the tasks
+        v21.exposure.on_finish = self.timing_flag.set
+        v21.encoder.add_listener(self.input_flag.set)
+        v21.buttons.on_event = self.input_flag.set
+
+    async def timing_task(self):
+        v21 = self.v21
+        while True:
+            if v21.state.mode == "Run":
+                # countdown needs refreshing even if nothing else happens
+                try:
+                    await asyncio.wait_for_ms(self.timing_flag.wait(), RUN_TICK_MS)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await self.timing_flag.wait()
+            v21.update_timer()
+            v21.update_lamp()
+            self.display_flag.set()
+
+    async def input_task(self):
+        v21 = self.v21
+        while True:
+            try:
+                await asyncio.wait_for_ms(self.input_flag.wait(), INPUT_POLL_MS)
+            except asyncio.TimeoutError:
+                pass
+            v21.watchdog.feed()
+            if v21.watchdog.tripped:
+                v21.lamp_cut()
+            mode = v21.state.mode
+            version = v21.state.version
+            v21.poll_encoder()
+            v21.poll_buttons()
+            v21.poll_remote()
+            v21.poll_sensor()
+            v21.update_settings()
+            if v21.state.mode != mode:
+                # starting, stopping and focusing are timing work
+                self.timing_flag.set()
+            if v21.state.version != version:
+                self.display_flag.set()
+
+    async def display_task(self):
+        v21 = self.v21
+        while True:
+            await self.display_flag.wait()
+            if v21.exposure.finished:
+                # the lamp is already off but get the mode right first
+                v21.update_timer()
+                v21.update_lamp()
+            v21.update_display()
+            await asyncio.sleep_ms(DISPLAY_MIN_MS)
+
+    async def main(self):
+        asyncio.create_task(self.timing_task())
+        asyncio.create_task(self.input_task())
+        await self.display_task()
+
+
+def run(v21):
+    asyncio.run(Runtime(v21).main())
@@ -0,0 +1,75 @@
+# Light sensor
+#
+# A photodiode on an ADC pin, face up on the baseboard, wired so that more
+# light gives a higher reading. It is for metering the projected image:
+# the exposure a negative needs goes inversely with the light reaching the
+# paper.
+#
+# Single ADC readings are noisy, so every PERIOD_MS poll() takes a short
+# burst of them into a preallocated array. The burst is sorted and the
+# middle half averaged, so spikes are dropped like a median would, and the
+# result is smoothed over successive bursts. Between bursts poll() costs
+# one ticks_diff. The main loop only polls while metering, so it never
+# runs during an exposure.
+
+from machine import ADC
+from micropython import const
+from array import array
+import time
+
+BURST = const(16) # readings per burst, about 40us
+PERIOD_MS = const(100) # a new reading ten times a second
+SETTLE_MS = const(500) # let the lamp warm up before trusting a reading
+SMOOTHING = const(4) # each burst counts for 1/SMOOTHING of the reading
+
+
+class LightSensor:
+
+    def __init__(self, pin_num=26):
+        self.adc = ADC(pin_num)
+        self.burst = array('H', [0] * BURST)
+        self.due = time.ticks_ms()
+        self.total = 0 # SMOOTHING times the reading
+        self.reading = -1 # smoothed 0-65535, -1 until there has been a burst
+        self.spread = 0 # spread of the middle half of the last burst, for noise
+
+    # start again, e.g. when the lamp has just come on
+    def restart(self):
+        self.due = time.ticks_add(time.ticks_ms(), SETTLE_MS)
+        self.reading = -1
+
+    # from the main loop, True when there is a new reading
+    def poll(self):
+        now = time.ticks_ms()
+        if time.ticks_diff(self.due, now) > 0:
+            return False
+        self.due = time.ticks_add(now, PERIOD_MS)
+
+        burst = self.burst
+        read = self.adc.read_u16
+        for i in range(BURST):
+            burst[i] = read()
+
+        # insertion sort, it is only 16 values
+        for i in range(1, BURST):
+            v = burst[i]
+            j = i - 1
+            while j >= 0 and burst[j] > v:
+                burst[j + 1] = burst[j]
+                j -= 1
+            burst[j + 1] = v
+
+        lo = BURST // 4
+        hi = BURST - BURST // 4
+        total = 0
+        for i in range(lo, hi):
+            total += burst[i]
+        value = total // (hi - lo)
+        self.spread = burst[hi - 1] - burst[lo]
+
+        if self.reading < 0:
+            self.total = value * SMOOTHING
+        else:
+            self.total += value - self.total // SMOOTHING
+        self.reading = self.total // SMOOTHING
+        return True
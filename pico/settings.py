@@ -0,0 +1,156 @@
+# Settings kept in flash
+#
+# The base, burn, test strip, meter reference and stop resolution survive
+# a power cycle.
+# They are stored as fixed size binary records in a ring of SLOTS slots in
+# one file. Each save goes into the slot after the newest, with a sequence
+# number and a CRC, so a save cut short by the power going leaves the
+# previous record to fall back on. On load the valid record with the
+# highest sequence number wins.
+#
+# A flash write stops the CPU for a few milliseconds, so saving is put off
+# until the settings have stopped changing: nothing is written until the
+# state has been quiet for QUIET_MS (spinning the encoder keeps it busy),
+# and never while the lamp is on. Lots of changes make one write.
+#
+#   >>> v21_timer.settings.report()
+
+from micropython import const
+import state
+import struct
+import time
+
+FILE = "settings.bin"
+SLOTS = const(8)
+SLOT_SIZE = const(32)
+MAGIC = const(0x5632) # "V2", change it if the record changes
+QUIET_MS = const(3000)
+
+# magic, sequence, base, burn, steps, interval, ref, ref_base, resolution
+# then the CRC. The burn is in clicks at that resolution
+_RECORD = "<HIfhBfHfB"
+_RECORD_SIZE = struct.calcsize(_RECORD)
+
+# the fields that are saved
+SAVED = (state.BASE | state.BURN | state.STEPS | state.INTERVAL | state.REF | state.REF_BASE
+         | state.RESOLUTION)
+
+
+# CRC-16/CCITT of the first n bytes
+def _crc16(buf, n):
+    crc = 0xffff
+    for i in range(n):
+        crc ^= buf[i] << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xffff
+            else:
+                crc = (crc << 1) & 0xffff
+    return crc
+
+
+class Settings:
+
+    def __init__(self, timer_state, path=None):
+        self.state = timer_state
+        self.path = path if path is not None else FILE
+        self.record = bytearray(SLOT_SIZE)
+        self.saved = bytearray(SLOT_SIZE) # the newest record in the file
+        self.slot = -1 # where the newest record is, -1 for none
+        self.seq = 0
+        self.pending = False # there are changes to save
+        self.quiet_since = time.ticks_ms()
+        self.writes = 0
+        self.write_us = 0 # how long the last save took
+        self.failures = 0
+
+        self.load()
+        # only changes from here on need saving
+        self.watcher = timer_state.watch()
+        timer_state.take(self.watcher)
+
+    # put the newest good record into the state
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return False
+        best = None
+        for slot in range(min(SLOTS, len(data) // SLOT_SIZE)):
+            at = slot * SLOT_SIZE
+            record = data[at:at + SLOT_SIZE]
+            fields = struct.unpack_from(_RECORD, record)
+            if fields[0] != MAGIC:
+                continue
+            crc = struct.unpack_from("<H", record, _RECORD_SIZE)[0]
+            if crc != _crc16(record, _RECORD_SIZE):
+                continue
+            if best is None or fields[1] > best[1]:
+                best = fields
+                self.slot = slot
+                self.saved[:] = record
+        if best is None:
+            return False
+        _, self.seq, base, burn, steps, interval, ref, ref_base, resolution = best
+        s = self.state
+        s.base = round(base, 1)
+        s.resolution = resolution
+        s.burn = burn
+        s.steps = steps
+        s.interval = round(interval, 1)
+        s.ref = ref
+        s.ref_base = round(ref_base, 1)
+        return True
+
+    # write the state into the next slot
+    def save(self):
+        s = self.state
+        slot = (self.slot + 1) % SLOTS
+        record = self.record
+        struct.pack_into(_RECORD, record, 0, MAGIC, self.seq + 1, s.base, s.burn,
+                         s.steps, s.interval, s.ref, s.ref_base, s.resolution)
+        if self.slot >= 0 and record[6:_RECORD_SIZE] == self.saved[6:_RECORD_SIZE]:
+            # changed and changed back, nothing to write
+            self.pending = False
+            return True
+        struct.pack_into("<H", record, _RECORD_SIZE, _crc16(record, _RECORD_SIZE))
+        start = time.ticks_us()
+        try:
+            try:
+                f = open(self.path, "r+b")
+            except OSError:
+                # first time, make the whole ring
+                f = open(self.path, "w+b")
+                f.write(bytearray(SLOTS * SLOT_SIZE))
+            f.seek(slot * SLOT_SIZE)
+            f.write(record)
+            f.close()
+        except OSError:
+            self.failures += 1
+            self.quiet_since = time.ticks_ms() # try again later, not every loop
+            return False
+        self.write_us = time.ticks_diff(time.ticks_us(), start)
+        self.writes += 1
+        self.slot = slot
+        self.seq += 1
+        self.saved[:] = record
+        self.pending = False
+        return True
+
+    # from the main loop, busy is True while the lamp is on
+    def poll(self, busy):
+        changed = self.state.take(self.watcher)
+        now = time.ticks_ms()
+        if changed:
+            self.quiet_since = now
+            if changed & SAVED:
+                self.pending = True
+        if not self.pending or busy:
+            return
+        if time.ticks_diff(now, self.quiet_since) >= QUIET_MS:
+            self.save()
+
+    def report(self):
+        print("saves", self.writes, "last took", self.write_us, "us", "slot", self.slot,
+              "sequence", self.seq, "failures", self.failures, "unsaved" if self.pending else "")
@@ -0,0 +1,103 @@
+# Timer state
+#
+# We work like a state machine: actions change the state and the display
+# and lamp follow it. Rather than comparing and copying a dict every time
+# round the loop, every real change to a field bumps `version` and sets the
+# field's bit in the dirty mask of each watcher. A watcher checks one
+# integer to see if anything happened and the mask to see what.
+
+from micropython import const
+
+MODE = const(0x0001)              # the mode we are in: Expose | Burn | Test | Program | Focus | Meter | Run | Paused
+MODE_PREV = const(0x0002)         # used to hold a previous state when we slip into Focus or Run
+RUN_DURATION = const(0x0004)      # total microseconds for this exposure
+RUN_REMAINING = const(0x0008)     # time microseconds left of this exposure
+RUN_REMAINING_TENTHS = const(0x0010) # the time left in whole tenths of a second (used for triggering display update)
+BASE = const(0x0020)              # the basic exposure in seconds
+STOPS = const(0x0040)             # clicks over or under the base we are set for a main exposure (see fstops.py)
+BURN = const(0x0080)              # clicks over the base exposure that are set for the next burn
+STEPS = const(0x0100)             # the number of steps in a test strip
+INTERVAL = const(0x0200)          # the size of a step in a test strip
+STEPS_MOD = const(0x0400)         # whether we are changing the steps or interval
+STEP = const(0x0800)              # the step that we are currently on
+REF = const(0x1000)               # illumination value stored for comparison (sensor reading, 0 for none)
+SAMPLE = const(0x2000)            # current illumination value (sensor reading)
+REF_BASE = const(0x4000)          # the base exposure that was right for the ref
+SEGMENT = const(0x8000)           # the segment of a program that is running
+PROGRAM = const(0x10000)          # bumped when the program is edited
+RESOLUTION = const(0x20000)       # clicks per stop: 10, 6 or 3
+ALL = const(0x3ffff)
+
+# field name -> bit
+BITS = {
+    "mode": MODE,
+    "mode_prev": MODE_PREV,
+    "run_duration": RUN_DURATION,
+    "run_remaining": RUN_REMAINING,
+    "run_remaining_tenths": RUN_REMAINING_TENTHS,
+    "base": BASE,
+    "stops": STOPS,
+    "burn": BURN,
+    "steps": STEPS,
+    "interval": INTERVAL,
+    "steps_mod": STEPS_MOD,
+    "step": STEP,
+    "ref": REF,
+    "sample": SAMPLE,
+    "ref_base": REF_BASE,
+    "segment": SEGMENT,
+    "program": PROGRAM,
+    "resolution": RESOLUTION,
+}
+
+
+class State:
+
+    __slots__ = ("mode", "mode_prev", "run_duration", "run_remaining",
+                 "run_remaining_tenths", "base", "stops", "burn", "steps",
+                 "interval", "steps_mod", "step", "ref", "sample",
+                 "ref_base", "segment", "program", "resolution", "version", "_dirty")
+
+    def __init__(self):
+        init = object.__setattr__
+        init(self, "version", 0)
+        init(self, "_dirty", [])
+        init(self, "mode", "Burn")
+        init(self, "mode_prev", None)
+        init(self, "run_duration", 0)
+        init(self, "run_remaining", 0)
+        init(self, "run_remaining_tenths", 0)
+        init(self, "base", 0.0)
+        init(self, "stops", 0)
+        init(self, "burn", 1)
+        init(self, "steps", 7)
+        init(self, "interval", 0.5)
+        init(self, "steps_mod", False)
+        init(self, "step", 0)
+        init(self, "ref", 0)
+        init(self, "sample", 0)
+        init(self, "ref_base", 0.0)
+        init(self, "segment", 0)
+        init(self, "program", 0)
+        init(self, "resolution", 10)
+
+    def __setattr__(self, name, value):
+        if getattr(self, name) == value:
+            return
+        bit = BITS[name]
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, "version", self.version + 1)
+        dirty = self._dirty
+        for i in range(len(dirty)):
+            dirty[i] |= bit
+
+    # register a consumer, everything starts dirty for it
+    def watch(self):
+        self._dirty.append(ALL)
+        return len(self._dirty) - 1
+
+    # the fields that changed since the watcher last asked
+    def take(self, watcher):
+        changed = self._dirty[watcher]
+        self._dirty[watcher] = 0
+        return changed
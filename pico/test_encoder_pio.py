@@ -0,0 +1,22 @@
+# Check the PIO encoder over USB serial, turn it both ways and
+# then quickly, every detent should show once and none be lost
+
+import time
+from rotary_pio_rp2 import RotaryPIO
+
+r = RotaryPIO(
+    pin_num_clk=8,
+    pin_num_dt=9,
+    reverse=True,
+    incr=1,
+    range_mode=RotaryPIO.RANGE_UNBOUNDED,
+    pull_up=True
+)
+
+val_old = r.value()
+while True:
+    val_new = r.value()
+    if val_old != val_new:
+        print("step =", val_new, "raw =", r._raw)
+        val_old = val_new
+    time.sleep_ms(100) # slow on purpose, the state machine keeps count meanwhile
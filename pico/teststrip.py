@@ -0,0 +1,51 @@
+# Test strip schedule
+#
+# A test strip is `steps` exposures either side of the base, each `interval`
+# stops apart. Each step uncovers another stripe so the durations are
+# incremental: step n only adds what the stripe needs over the ones
+# before it. The table is only worked out when base, steps or interval
+# change, after that looking up a step is just indexing an array.
+
+from array import array
+
+
+class TestStripSchedule:
+
+    def __init__(self):
+        self.base = None
+        self.steps = 0
+        self.interval = None
+        self.targets = array('f') # total exposure each stripe should get
+        self.durations = array('f') # what each step adds to the strip
+
+    # rebuild the table if anything has changed
+    def update(self, base, steps, interval):
+        if base == self.base and steps == self.steps and interval == self.interval:
+            return
+        self.base = base
+        self.steps = steps
+        self.interval = interval
+
+        either_side = (steps - 1) // 2
+        targets = array('f', [0.0] * steps)
+        durations = array('f', [0.0] * steps)
+        total = 0.0
+        for i in range(steps):
+            # work from the right, lightest stripe first
+            target = base * pow(2, (i - either_side) * interval)
+            targets[i] = target
+            durations[i] = target - total
+            total = target
+        self.targets = targets
+        self.durations = durations
+
+    # seconds to add for step (0 based)
+    def duration(self, step):
+        return self.durations[step]
+
+    # total seconds the stripe for step will have had
+    def target(self, step):
+        return self.targets[step]
+
+    def __len__(self):
+        return self.steps
@@ -0,0 +1,173 @@
+# Loop supervisor
+#
+# If the main loop stops going round (a hung I2C transfer, an exception,
+# a bug) while the lamp is on, the print is ruined and the lamp stays on
+# until someone pulls the plug. Two layers stop that:
+#   - a hard timer interrupt checks every CHECK_MS that the loop has been
+#     round recently, and if it hasn't and the lamp is on it switches the
+#     relay off itself and notes when, and calls on_cut so the exposure
+#     engine stops timing there and then (even if the stall outlasts the
+#     exposure). The loop sees `tripped` once it gets going again and
+#     shows the exposure paused from that moment, so it can be resumed
+#     without losing any time.
+#   - machine.WDT resets the Pico if the loop stops for WDT_MS, which
+#     leaves the relay pin pulled down. This can't be stopped once started,
+#     so it is only switched on when the timer is running for real (see
+#     main.py), not at the REPL.
+#
+# The loop calls stage() before each part of an iteration and feed() at the
+# start of the next, which also gives the worst time seen for each part:
+#
+#   >>> v21_timer.watchdog.report()
+#
+# though with the hardware watchdog on, stopping at the REPL resets the
+# Pico, so on a working unit send "wd" over serial instead (see remote.py)
+#
+# and can pass every one of those times on to a profiler (see profiler.py).
+
+from machine import Timer, WDT
+from micropython import const
+from array import array
+import time
+
+STALL_MS = const(200) # a loop iteration this long with the lamp on cuts it
+CHECK_MS = const(20)
+WDT_MS = const(5000) # must cover the slowest thing the loop does with the lamp off
+HISTORY = const(16)
+
+# the parts of a loop iteration, in the order V21.tick() does them
+ENCODER = const(0)
+BUTTONS = const(1)
+REMOTE = const(2)
+SENSOR = const(3)
+DISPLAY = const(4)
+TIMER = const(5)
+LAMP = const(6)
+SETTINGS = const(7)
+IDLE = const(8)
+STAGES = ("encoder", "buttons", "remote", "sensor", "display", "timer", "lamp", "settings", "idle")
+
+
+class Supervisor:
+
+    def __init__(self, lamp, stall_ms=STALL_MS):
+        self.lamp = lamp
+        self.stall_ms = stall_ms
+        self.timer = Timer()
+        self.wdt = None
+        self.running = False
+
+        # this iteration
+        self.fed = time.ticks_ms() # when the loop last came round, ms for the timer
+        self.iteration_start = time.ticks_us()
+        self.stage_start = self.iteration_start
+        self.current = ENCODER # the part of the loop that is running
+        self.slowest = ENCODER # the slowest part so far this iteration
+        self.slowest_us = 0
+
+        # set by the timer interrupt when it cuts the lamp
+        self.tripped = False
+        self.cut_us = 0 # ticks_us the relay was switched off
+        self.cut_stage = 0 # what the loop was doing
+        self.on_cut = None # optional, called from the interrupt with cut_us (must be IRQ safe)
+
+        # figures
+        self.iterations = 0
+        self.worst_us = 0 # longest iteration
+        self.stage_worst_us = array('l', [0] * len(STAGES)) # longest time in each part
+        self.cuts = 0
+        self.errors = 0
+        self.last_error = None
+        self.stalls = 0 # iterations longer than stall_ms, lamp on or not
+        self.stall_ms_log = array('l', [0] * HISTORY) # the last few
+        self.stall_stage_log = bytearray(HISTORY)
+        self.stall_next = 0
+
+        self.profiler = None # set by Profiler.start()
+
+        self._check_cb = self._check # bind once, the interrupt can't allocate
+
+    # start watching, wdt for the hardware watchdog as well
+    def start(self, wdt=False):
+        # from now, not from when the timer was built
+        self.iteration_start = self.stage_start = time.ticks_us()
+        self.current = ENCODER
+        self.fed = time.ticks_ms()
+        self.running = True
+        self.timer.init(mode=Timer.PERIODIC, period=CHECK_MS, callback=self._check_cb, hard=True)
+        if wdt:
+            self.wdt = WDT(timeout=WDT_MS)
+
+    def stop(self):
+        self.timer.deinit()
+        self.running = False
+
+    # the loop is about to start on another part of the iteration
+    def stage(self, which):
+        now = time.ticks_us()
+        spent = time.ticks_diff(now, self.stage_start)
+        current = self.current
+        if spent > self.stage_worst_us[current]:
+            self.stage_worst_us[current] = spent
+        if spent > self.slowest_us:
+            self.slowest_us = spent
+            self.slowest = current
+        if self.profiler is not None:
+            self.profiler.add(current, spent)
+        self.current = which
+        self.stage_start = now
+
+    # the loop has come round again
+    def feed(self):
+        self.stage(ENCODER)
+        now = self.stage_start
+        spent = time.ticks_diff(now, self.iteration_start)
+        if spent > self.worst_us:
+            self.worst_us = spent
+        if spent > self.stall_ms * 1000:
+            self._stall(spent // 1000, self.slowest)
+        if self.profiler is not None:
+            self.profiler.loop(spent)
+        self.iteration_start = now
+        self.slowest_us = 0
+        self.iterations += 1
+        self.fed = time.ticks_ms()
+        if self.wdt is not None:
+            self.wdt.feed()
+
+    # the loop caught an exception, it goes down as a stall of no time
+    def error(self, e):
+        self.errors += 1
+        self.last_error = e
+        self._stall(0, self.current)
+
+    def _stall(self, ms, stage):
+        i = self.stall_next
+        self.stall_ms_log[i] = ms
+        self.stall_stage_log[i] = stage
+        self.stall_next = (i + 1) % HISTORY
+        self.stalls += 1
+
+    # hard interrupt, no allocation
+    def _check(self, timer):
+        if self.tripped or not self.lamp.value():
+            return
+        if time.ticks_diff(time.ticks_ms(), self.fed) > self.stall_ms:
+            self.lamp.value(0)
+            self.cut_us = time.ticks_us()
+            self.cut_stage = self.current
+            self.tripped = True
+            self.cuts += 1
+            if self.on_cut is not None:
+                self.on_cut(self.cut_us)
+
+    # to the REPL, or out (the remote's "wd" command)
+    def report(self, out=None):
+        print("iterations", self.iterations, "worst", self.worst_us, "us", "lamp cuts", self.cuts,
+              "errors", self.errors, self.last_error if self.last_error is not None else "", file=out)
+        for i in range(len(STAGES)):
+            print("  ", STAGES[i], "worst", self.stage_worst_us[i], "us", file=out)
+        n = min(self.stalls, HISTORY)
+        for k in range(n):
+            i = (self.stall_next - n + k) % HISTORY
+            print("  stall", self.stall_ms_log[i], "ms in", STAGES[self.stall_stage_log[i]], file=out)
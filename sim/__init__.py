@@ -0,0 +1,183 @@
+# Host simulator for the V21 timer
+#
+# Runs the code in ../pico under CPython against fake machine, micropython,
+# time, gc, select and array modules driven by a virtual clock, so the timer can be exercised,
+# profiled and regression tested on an ordinary computer:
+#
+#   from sim import Simulator
+#   s = Simulator()
+#   s.press("run")
+#   s.run_for(5000)
+#   print(s.lamp_periods())
+#
+# Only one Simulator is live at a time; making a new one reloads the pico
+# modules against a fresh clock.
+
+import builtins
+import os
+import sys
+import tempfile
+
+from sim import array
+from sim import gc
+from sim import machine
+from sim import micropython
+from sim import select
+from sim import usb
+from sim import utime
+from sim.clock import Clock
+
+PICO_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pico")
+
+# the modules that make up the firmware
+PICO_MODULES = ("RGB1602", "rotary", "rotary_irq_rp2", "exposure", "buzzer",
+                "buttons", "teststrip", "program", "state", "accuracy", "heap", "sensor", "settings", "remote", "watchdog", "profiler", "idle", "fstops", "dualcore", "main")
+
+# GPIO wiring, see the table in the top level README
+BUTTONS = {"set": 1, "mode": 10, "run": 16, "focus": 17}
+ENCODER_CLK = 8
+ENCODER_DT = 9
+LAMP = 27
+BUZZER = 13
+SENSOR = 26
+
+_FULL_HZ = 125000000 # the clock loop_us is for
+
+# CLK/DT levels through one full detent, see the table in rotary.py
+_CW = ((1, 0), (0, 0), (0, 1), (1, 1))
+_CCW = ((0, 1), (0, 0), (1, 0), (1, 1))
+
+
+class Simulator:
+
+    def __init__(self, bus_us_per_byte=22.5, bus_us_per_transfer=25.0, loop_us=50, start=True,
+                 settings_file=None):
+        self.clock = Clock()
+        self.loop_us = loop_us # host-free CPU cost charged for each tick()
+        self.iterations = 0
+        machine.reset(self.clock)
+        machine.I2C.us_per_byte = bus_us_per_byte
+        machine.I2C.us_per_transfer = bus_us_per_transfer
+        self.modules = _load_pico()
+        # saved settings go somewhere of their own unless asked to share
+        if settings_file is None:
+            settings_file = os.path.join(tempfile.mkdtemp(prefix="v21sim"), "settings.bin")
+        self.modules["settings"].FILE = settings_file
+        # the USB serial port for remote control
+        self.serial = usb.Serial()
+        self.modules["remote"].INPUT = self.serial
+        self.modules["remote"].OUTPUT = self.serial
+        self.main = self.modules["main"]
+        self.v21 = self.main.V21() if start else None
+
+    # ---- time
+
+    @property
+    def now_ms(self):
+        return self.clock.now_us / 1000
+
+    def tick(self):
+        self.v21.tick()
+        self.iterations += 1
+        if self.loop_us:
+            # the same work takes longer with the clock turned down
+            self.clock.advance(self.loop_us * _FULL_HZ / machine.freq_hz)
+
+    def run_for(self, ms):
+        end = self.clock.now_us + ms * 1000
+        while self.clock.now_us < end:
+            self.tick()
+
+    def run_until(self, condition, timeout_ms=600000):
+        end = self.clock.now_us + timeout_ms * 1000
+        while not condition():
+            if self.clock.now_us >= end:
+                raise TimeoutError("simulated %d ms without the condition" % timeout_ms)
+            self.tick()
+
+    # ---- input
+
+    def press(self, button, hold_ms=80, settle_ms=20):
+        pin = BUTTONS[button]
+        machine.set_input(pin, 0)
+        self._run_during(hold_ms)
+        machine.set_input(pin, 1)
+        self._run_during(settle_ms)
+
+    def turn(self, clicks, edge_us=800):
+        steps = _CW if clicks > 0 else _CCW
+        for _ in range(abs(clicks)):
+            for clk, dt in steps:
+                machine.set_input(ENCODER_CLK, clk)
+                machine.set_input(ENCODER_DT, dt)
+                self.clock.advance(edge_us)
+        self.tick()
+
+    # light on the photodiode, 0-65535 as read by the ADC
+    def set_light(self, level):
+        machine.set_analog(SENSOR, level)
+
+    def _run_during(self, ms):
+        # keep the main loop going while a button is held
+        end = self.clock.now_us + ms * 1000
+        while self.clock.now_us < end:
+            self.tick()
+
+    # ---- output
+
+    @property
+    def lamp(self):
+        return machine.board[LAMP].level
+
+    # (on_us, off_us) for each time the relay closed
+    def lamp_periods(self):
+        periods = []
+        on = None
+        for when, level in machine.board[LAMP].history:
+            if level and on is None:
+                on = when
+            elif not level and on is not None:
+                periods.append((on, when))
+                on = None
+        return periods
+
+    @property
+    def i2c(self):
+        return machine.I2C.instances[0]
+
+    @property
+    def buzzer_log(self):
+        return [pwm.log for pwm in machine.PWM.instances]
+
+    # what the LCD is currently showing
+    def screen(self):
+        lcd = self.v21.lcd
+        shown = bytes(lcd._shown)
+        return [shown[row * lcd._col:(row + 1) * lcd._col].decode('latin-1') for row in range(lcd._row)]
+
+
+def _load_pico():
+    # MicroPython's compiler knows const() without an import
+    builtins.const = micropython.const
+    sys.modules["machine"] = machine
+    sys.modules["micropython"] = micropython
+
+    # the firmware imports these too but must only see the fake ones
+    fakes = {"time": utime, "gc": gc, "select": select, "array": array}
+    saved = {name: sys.modules.get(name) for name in fakes}
+    sys.modules.update(fakes)
+    sys.path.insert(0, PICO_DIR)
+    try:
+        modules = {}
+        for name in PICO_MODULES:
+            sys.modules.pop(name, None)
+        for name in PICO_MODULES:
+            modules[name] = __import__(name)
+        return modules
+    finally:
+        sys.path.remove(PICO_DIR)
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
@@ -0,0 +1,15 @@
+# Fake array module
+#
+# Installed as `array` while the pico modules are imported. On the RP2040
+# 'l' and 'L' are 32 bits but CPython's are usually 64, so a value that
+# would overflow on the Pico would pass unnoticed here. They are swapped
+# for 'i' and 'I', which are 32 bits, and storing too big a value raises
+# OverflowError.
+
+import array as _array
+
+_TYPECODES = {"l": "i", "L": "I"}
+
+
+def array(typecode, initializer=()):
+    return _array.array(_TYPECODES.get(typecode, typecode), initializer)
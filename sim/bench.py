@@ -0,0 +1,300 @@
+# Benchmarks for the V21 timer
+#
+# Drives the firmware through scripted sessions in the simulator and
+# reports, for each mode:
+#   - main loop iteration latency (virtual microseconds, percentiles)
+#   - I2C transfers and bytes per second
+#   - heap churn per iteration (the most allocated at once and freed
+#     again, from tracemalloc, a host-side stand in for GC pressure on the
+#     Pico). What the tracing and the simulator's own tick cost is measured
+#     first with the firmware's tick swapped for a no-op and taken off, so
+#     a loop that allocates nothing reads close to 0. What is left still
+#     includes CPython boxing the bigger ints that are free on the Pico.
+# the lamp-off error: how far the relay's real on-time was from the
+# requested run_duration, over a spread of exposures with and without
+# pauses, and the wake latency: how long a button pressed while the timer
+# has slowed down for being idle takes to change the mode.
+#
+#   python -m sim.bench                        # run and save bench_results.json in the temp directory
+#   python -m sim.bench --compare old.json     # and show the change
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from sim import BUTTONS, Simulator
+from sim import machine
+
+MODES = ("Expose", "Burn", "Test", "Focus", "Run", "Paused")
+
+# exposures for the lamp-off error, seconds
+DURATIONS = (0.3, 0.5, 1.0, 2.3, 4.0, 7.7, 16.0)
+
+# CPU time charged for each main loop iteration on top of any I2C traffic
+LOOP_US = 200
+
+# presses for the wake latency, each after this long idle
+WAKE_TRIALS = 12
+WAKE_IDLE_MS = 3000
+
+# no-op ticks to find the churn floor
+CALIBRATION_TICKS = 200
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarise(values):
+    return {
+        "n": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+class Recorder:
+
+    # wraps Simulator.tick to measure every main loop iteration
+    def __init__(self, sim):
+        self.sim = sim
+        self.latency = {mode: [] for mode in MODES}
+        self.churn = {mode: [] for mode in MODES}
+        self.virtual_us = {mode: 0.0 for mode in MODES}
+        self.transfers = {mode: 0 for mode in MODES}
+        self.bytes = {mode: 0 for mode in MODES}
+        self._tick = sim.tick
+        self.floor = self.calibrate()
+        sim.tick = self.tick
+
+    # peak bytes over a call to the simulator's tick
+    def measure(self):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        self._tick()
+        _, peak = tracemalloc.get_traced_memory()
+        return peak - before
+
+    # what a tick costs with nothing in the firmware's
+    def calibrate(self):
+        v21 = self.sim.v21
+        v21.tick = lambda: None
+        try:
+            return statistics.median(self.measure() for i in range(CALIBRATION_TICKS))
+        finally:
+            del v21.tick
+
+    def tick(self):
+        sim = self.sim
+        mode = sim.v21.state.mode
+        i2c = sim.i2c
+        transfers, nbytes = i2c.transfers, i2c.bytes
+        start = sim.clock.now_us
+        churn = self.measure()
+        spent = sim.clock.now_us - start
+        if mode in self.latency:
+            self.latency[mode].append(spent)
+            self.churn[mode].append(max(0, churn - self.floor))
+            self.virtual_us[mode] += spent
+            self.transfers[mode] += i2c.transfers - transfers
+            self.bytes[mode] += i2c.bytes - nbytes
+
+    def report(self):
+        modes = {}
+        for mode in MODES:
+            if not self.latency[mode]:
+                continue
+            seconds = self.virtual_us[mode] / 1000000
+            modes[mode] = {
+                "iterations": len(self.latency[mode]),
+                "latency_us": summarise(self.latency[mode]),
+                "i2c_transfers_per_s": self.transfers[mode] / seconds,
+                "i2c_bytes_per_s": self.bytes[mode] / seconds,
+                "churn_bytes_per_iter": summarise(self.churn[mode]),
+            }
+        return modes
+
+
+def setting_sessions(sim):
+    # Expose: dial the stops up and down
+    sim.run_for(500)
+    for clicks in (3, -6, 2, 1):
+        sim.turn(clicks)
+        sim.run_for(200)
+    # Burn
+    sim.press("mode")
+    for clicks in (-4, 2):
+        sim.turn(clicks)
+        sim.run_for(200)
+    # Test: steps then interval
+    sim.press("mode")
+    sim.press("set")
+    sim.turn(-2)
+    sim.run_for(200)
+    sim.press("set")
+    sim.turn(-1)
+    sim.run_for(200)
+    # Focus
+    sim.press("focus")
+    sim.run_for(2000)
+    sim.press("focus")
+    # back round to Expose
+    sim.press("mode")
+    sim.run_for(200)
+
+
+def exposure_session(sim, seconds, pause_at=None, pause_ms=700):
+    v21 = sim.v21
+    v21.state.base = seconds
+    v21.set_stops(0)
+    sim.tick()
+    first = len(sim.lamp_periods())
+    sim.press("run", hold_ms=40, settle_ms=0)
+    requested = v21.state.run_duration / 1000.0 # ms
+    if pause_at is not None:
+        sim.run_for(pause_at * 1000)
+        sim.press("run", hold_ms=40, settle_ms=0)
+        sim.run_for(pause_ms)
+        sim.press("run", hold_ms=40, settle_ms=0)
+    sim.run_until(lambda: v21.state.mode != "Run" and v21.state.mode != "Paused")
+    sim.run_for(600) # the end beep
+    lit = sum(off - on for on, off in sim.lamp_periods()[first:]) / 1000.0
+    return lit - requested
+
+
+def wake_session(sim, trials=WAKE_TRIALS):
+    v21 = sim.v21
+    pin = BUTTONS["mode"]
+    latencies = []
+    for i in range(trials):
+        sim.run_for(WAKE_IDLE_MS)
+        # pressed from a timer so it can land in the middle of a nap
+        pressed = []
+        def press(timer):
+            machine.set_input(pin, 0)
+            pressed.append(sim.clock.now_us)
+        timer = machine.Timer()
+        timer.init(mode=machine.Timer.ONE_SHOT, period=1 + (i * 7) % 13, callback=press)
+        mode = v21.state.mode
+        sim.run_until(lambda: v21.state.mode != mode)
+        latencies.append((sim.clock.now_us - pressed[0]) / 1000.0)
+        machine.set_input(pin, 1)
+        sim.run_for(100)
+    # back to where it started
+    while v21.state.mode != "Expose":
+        sim.press("mode")
+    return latencies
+
+
+def run():
+    tracemalloc.start()
+    started = time.perf_counter()
+    sim = Simulator(loop_us=LOOP_US)
+    sim.v21.watchdog.start()
+    recorder = Recorder(sim)
+
+    setting_sessions(sim)
+    wake = wake_session(sim)
+
+    errors = []
+    paused_errors = []
+    for seconds in DURATIONS:
+        errors.append(exposure_session(sim, seconds))
+    for seconds in DURATIONS:
+        if seconds >= 1.0:
+            paused_errors.append(exposure_session(sim, seconds, pause_at=seconds / 3))
+
+    tracemalloc.stop()
+    return {
+        "modes": recorder.report(),
+        "churn_floor_bytes": recorder.floor,
+        "lamp_off_error_ms": summarise(errors),
+        "lamp_off_error_paused_ms": summarise(paused_errors),
+        "wake_latency_ms": summarise(wake),
+        "virtual_seconds": sim.clock.now_us / 1000000,
+        "host_seconds": time.perf_counter() - started,
+    }
+
+
+def show(results, baseline=None):
+
+    def delta(now, then):
+        if then is None:
+            return ""
+        if then == 0:
+            return "" if now == 0 else "   (new)"
+        return "   (%+.0f%%)" % (100.0 * (now - then) / then)
+
+    def base_mode(mode, *keys):
+        if baseline is None:
+            return None
+        value = baseline.get("modes", {}).get(mode)
+        for key in keys:
+            if value is None:
+                return None
+            value = value.get(key)
+        return value
+
+    print("%-7s %8s %9s %9s %9s %10s %10s %9s" % (
+        "mode", "iters", "p50 us", "p99 us", "max us", "i2c tx/s", "i2c B/s", "churn B"))
+    for mode, m in results["modes"].items():
+        lat = m["latency_us"]
+        print("%-7s %8d %9.1f %9.1f %9.1f %10.1f %10.1f %9.1f" % (
+            mode, m["iterations"], lat["p50"], lat["p99"], lat["max"],
+            m["i2c_transfers_per_s"], m["i2c_bytes_per_s"], m["churn_bytes_per_iter"]["mean"]))
+        if baseline is not None:
+            print("%-7s %8s %9s %9s %9s %10s %10s %9s" % (
+                "", "",
+                delta(lat["p50"], base_mode(mode, "latency_us", "p50")),
+                delta(lat["p99"], base_mode(mode, "latency_us", "p99")),
+                delta(lat["max"], base_mode(mode, "latency_us", "max")),
+                delta(m["i2c_transfers_per_s"], base_mode(mode, "i2c_transfers_per_s")),
+                delta(m["i2c_bytes_per_s"], base_mode(mode, "i2c_bytes_per_s")),
+                delta(m["churn_bytes_per_iter"]["mean"], base_mode(mode, "churn_bytes_per_iter", "mean"))))
+
+    for key, title in (("lamp_off_error_ms", "lamp-off error"), ("lamp_off_error_paused_ms", "  with a pause")):
+        err = results[key]
+        then = baseline.get(key, {}).get("max") if baseline else None
+        print("%-16s mean %7.3f ms  p90 %7.3f ms  max %7.3f ms%s" % (
+            title, err["mean"], err["p90"], err["max"], delta(err["max"], then)))
+    wake = results["wake_latency_ms"]
+    then = baseline.get("wake_latency_ms", {}).get("max") if baseline else None
+    print("%-16s mean %7.3f ms  p90 %7.3f ms  max %7.3f ms%s" % (
+        "wake latency", wake["mean"], wake["p90"], wake["max"], delta(wake["max"], then)))
+    print("churn is over a floor of %d B a tick" % results["churn_floor_bytes"])
+    print("%.1f simulated seconds in %.1f s" % (results["virtual_seconds"], results["host_seconds"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the V21 timer in the simulator")
+    parser.add_argument("--out", default=os.path.join(tempfile.gettempdir(), "bench_results.json"),
+                        help="where to save the results")
+    parser.add_argument("--compare", help="results from an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = run()
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    show(results, baseline)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print("saved", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Virtual clock
+#
+# Stands in for the Pico's microsecond counter. Time only moves when
+# something spends it (a sleep, an I2C transfer, the simulated cost of a
+# loop) and any timers that fall due on the way are fired in order, just
+# as their interrupts would on the device.
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+
+class Clock:
+
+    def __init__(self):
+        self.now_us = 0 # never wraps (and may be fractional), ticks_* wrap like MicroPython's
+        self._timers = [] # armed machine.Timer objects
+        self._scheduled = [] # micropython.schedule queue
+        self._firing = False
+
+    # ---- MicroPython style ticks
+
+    def ticks_us(self):
+        return int(self.now_us) & TICKS_MAX
+
+    def ticks_ms(self):
+        return int(self.now_us // 1000) & TICKS_MAX
+
+    def ticks_cpu(self):
+        return self.ticks_us()
+
+    @staticmethod
+    def ticks_add(ticks, delta):
+        return (ticks + delta) & TICKS_MAX
+
+    @staticmethod
+    def ticks_diff(end, start):
+        return ((end - start + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+    # ---- spending time
+
+    # atomic is for time spent inside one C call (an I2C transfer): hard
+    # callbacks still interrupt it but soft ones have to wait for the end
+    def advance(self, us, atomic=False):
+        self.advance_to(self.now_us + us, atomic)
+
+    def advance_to(self, when_us, atomic=False):
+        while True:
+            due = self._next_due(when_us)
+            if due is None:
+                break
+            self.now_us = max(self.now_us, due.due_us)
+            due.fire()
+            if not atomic:
+                self.run_scheduled()
+        self.now_us = max(self.now_us, when_us)
+        self.run_scheduled()
+
+    # when a wait for an interrupt that gives up at when_us would end
+    def next_wake(self, when_us):
+        due = self._next_due(when_us)
+        return when_us if due is None else max(self.now_us, due.due_us)
+
+    def _next_due(self, when_us):
+        due = None
+        for timer in self._timers:
+            if timer.due_us <= when_us and (due is None or timer.due_us < due.due_us):
+                due = timer
+        return due
+
+    # ---- used by the fake machine and micropython modules
+
+    def arm(self, timer):
+        if timer not in self._timers:
+            self._timers.append(timer)
+
+    def disarm(self, timer):
+        if timer in self._timers:
+            self._timers.remove(timer)
+
+    def schedule(self, func, arg):
+        if len(self._scheduled) >= 8:
+            raise RuntimeError("schedule queue full")
+        self._scheduled.append((func, arg))
+
+    def run_scheduled(self):
+        if self._firing:
+            return
+        self._firing = True
+        try:
+            while self._scheduled:
+                func, arg = self._scheduled.pop(0)
+                func(arg)
+        finally:
+            self._firing = False
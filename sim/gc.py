@@ -0,0 +1,46 @@
+# Fake gc module
+#
+# Installed as `gc` while the pico modules are imported. Collection control
+# is recorded rather than passed on to CPython. The host has no Pico heap
+# so the memory figures are nominal; use the benchmark's churn numbers to
+# see what the firmware allocates.
+
+import gc as _gc
+
+HEAP = 192 * 1024
+USED = 32 * 1024
+
+enabled = True
+collections = 0
+
+
+def collect():
+    global collections
+    collections += 1
+    _gc.collect()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def isenabled():
+    return enabled
+
+
+def mem_alloc():
+    return USED
+
+
+def mem_free():
+    return HEAP - USED
+
+
+def threshold(amount=None):
+    return -1
@@ -0,0 +1,300 @@
+# Fake machine module
+#
+# Just enough of MicroPython's machine module for the timer to run on a
+# host. Everything shares the Clock installed by the Simulator: timers fire
+# off it, I2C transfers spend time on it and pins log their changes with
+# it so we can see exactly when the relay opened.
+
+clock = None # set by Simulator
+board = {} # pin id -> _PinState
+freq_hz = 125000000
+
+
+def reset(new_clock):
+    global clock, freq_hz
+    clock = new_clock
+    board.clear()
+    freq_hz = 125000000
+    I2C.instances = []
+    PWM.instances = []
+    WDT.instances = []
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state):
+    pass
+
+
+def freq(hz=None):
+    global freq_hz
+    if hz is None:
+        return freq_hz
+    freq_hz = hz
+
+
+# like the rp2 port, back at the next interrupt or after 1 ms. Inputs
+# only change between Simulator calls so timers are the only interrupts
+def idle():
+    clock.advance_to(clock.next_wake(clock.now_us + 1000))
+
+
+def lightsleep(ms=None):
+    clock.advance(1000 * (ms or 0))
+
+
+def unique_id():
+    return b'\x00\x00\x00\x00\x00\x00\x00\x00'
+
+
+class _PinState:
+
+    def __init__(self, pin_id):
+        self.id = pin_id
+        self.level = 0
+        self.mode = None
+        self.pull = None
+        self.owner = None # the Pin that installed the irq
+        self.handler = None
+        self.trigger = 0
+        self.hard = False
+        self.history = [] # (now_us, level) for outputs
+        self.analog = 0 # what an ADC on this pin reads, 0-65535
+
+
+class Pin:
+
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, pin_id, mode=-1, pull=-1, value=None):
+        if pin_id not in board:
+            board[pin_id] = _PinState(pin_id)
+        self._state = board[pin_id]
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        state = self._state
+        if mode != -1:
+            state.mode = mode
+        if pull != -1:
+            state.pull = pull
+            if state.mode == Pin.IN:
+                state.level = 1 if pull == Pin.PULL_UP else 0
+        if value is not None:
+            self.value(value)
+
+    def value(self, level=None):
+        state = self._state
+        if level is None:
+            return state.level
+        level = 1 if level else 0
+        if level != state.level or not state.history:
+            state.history.append((clock.now_us, level))
+        state.level = level
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def toggle(self):
+        self.value(1 - self._state.level)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        state = self._state
+        state.owner = self
+        state.handler = handler
+        state.trigger = trigger if handler else 0
+        state.hard = hard
+
+    def __repr__(self):
+        return "Pin(%d)" % self._state.id
+
+
+# drive an input pin from outside, as a button or encoder would
+def set_input(pin_id, level):
+    state = board[pin_id]
+    level = 1 if level else 0
+    if level == state.level:
+        return
+    state.level = level
+    edge = Pin.IRQ_RISING if level else Pin.IRQ_FALLING
+    if state.handler and state.trigger & edge:
+        if state.hard:
+            state.handler(state.owner)
+        else:
+            clock.schedule(state.handler, state.owner)
+        clock.run_scheduled()
+
+
+# put a voltage on an ADC pin, as 0-65535
+def set_analog(pin_id, value):
+    if pin_id not in board:
+        board[pin_id] = _PinState(pin_id)
+    board[pin_id].analog = max(0, min(65535, int(value)))
+
+
+class ADC:
+
+    # a conversion takes 2us on the RP2040
+    us_per_read = 2
+
+    def __init__(self, pin):
+        pin_id = pin._state.id if isinstance(pin, Pin) else pin
+        if pin_id not in board:
+            board[pin_id] = _PinState(pin_id)
+        self._state = board[pin_id]
+        self.reads = 0
+
+    def read_u16(self):
+        self.reads += 1
+        clock.advance(ADC.us_per_read, atomic=True)
+        return self._state.analog
+
+
+class PWM:
+
+    instances = []
+
+    def __init__(self, pin, freq=0, duty_u16=0):
+        self.pin = pin
+        self.log = [] # (now_us, freq or 0 when off)
+        self._freq = 0
+        self._duty = 0
+        PWM.instances.append(self)
+        self.init(freq=freq, duty_u16=duty_u16)
+
+    def init(self, freq=None, duty_u16=None):
+        if freq is not None:
+            self._freq = freq
+        if duty_u16 is not None:
+            self._duty = duty_u16
+        self.log.append((clock.now_us, self._freq))
+
+    def deinit(self):
+        self.log.append((clock.now_us, 0))
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+
+
+class I2C:
+
+    # bus cost, set by the Simulator: 9 clocks a byte at 400kHz is 22.5us
+    us_per_byte = 22.5
+    us_per_transfer = 25.0 # start, address byte and stop
+    instances = []
+
+    def __init__(self, bus_id=0, scl=None, sda=None, freq=400000):
+        self.bus_id = bus_id
+        self.freq = freq
+        self.transfers = 0
+        self.bytes = 0
+        self.busy_us = 0
+        self.log = None # set to a list to record (now_us, addr, bytes)
+        I2C.instances.append(self)
+
+    def _spend(self, addr, data):
+        n = len(data)
+        self.transfers += 1
+        self.bytes += n
+        cost = I2C.us_per_transfer + I2C.us_per_byte * n
+        self.busy_us += cost
+        if self.log is not None:
+            self.log.append((clock.now_us, addr, bytes(data)))
+        # a transfer is one C call, soft callbacks wait until it returns
+        clock.advance(cost, atomic=True)
+
+    def writeto(self, addr, buf, stop=True):
+        self._spend(addr, bytes(buf))
+        return 1
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        if isinstance(buf, str):
+            buf = buf.encode('latin-1')
+        self._spend(addr, bytes([memaddr]) + bytes(buf))
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        self._spend(addr, bytes([memaddr]) + bytes(nbytes))
+        return bytes(nbytes)
+
+    def scan(self):
+        return [0x3e, 0x60]
+
+
+class WDT:
+
+    instances = []
+
+    def __init__(self, id=0, timeout=5000):
+        self.timeout_ms = timeout
+        self.fed_us = clock.now_us
+        self.longest_ms = 0 # longest gap between feeds, more than timeout_ms would have reset
+        WDT.instances.append(self)
+
+    def feed(self):
+        gap = (clock.now_us - self.fed_us) / 1000
+        self.longest_ms = max(self.longest_ms, gap)
+        self.fed_us = clock.now_us
+
+    @property
+    def would_reset(self):
+        return self.longest_ms > self.timeout_ms
+
+
+class Timer:
+
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, timer_id=-1, **kwargs):
+        self.due_us = 0
+        self.period_us = 0
+        self.mode = Timer.ONE_SHOT
+        self.callback = None
+        self.hard = False
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None, hard=False, tick_hz=1000):
+        self.mode = mode
+        if freq != -1:
+            self.period_us = int(1000000 / freq)
+        else:
+            self.period_us = int(period * 1000000 / tick_hz)
+        self.callback = callback
+        self.hard = hard
+        self.due_us = clock.now_us + self.period_us
+        clock.arm(self)
+
+    def deinit(self):
+        clock.disarm(self)
+
+    def fire(self):
+        if self.mode == Timer.PERIODIC:
+            self.due_us += max(1, self.period_us)
+        else:
+            clock.disarm(self)
+        if self.callback is None:
+            return
+        if self.hard:
+            self.callback(self)
+        else:
+            clock.schedule(self.callback, self)
@@ -0,0 +1,31 @@
+# Fake micropython module
+
+from sim import machine
+
+
+def const(value):
+    return value
+
+
+def schedule(func, arg):
+    machine.clock.schedule(func, arg)
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def mem_info(verbose=None):
+    print("mem: host simulation")
+
+
+def opt_level(level=None):
+    return 0
+
+
+def native(func):
+    return func
+
+
+def viper(func):
+    return func
@@ -0,0 +1,46 @@
+# Fake select module
+#
+# Installed as `select` while the pico modules are imported. Only polling
+# is needed, of things with a pending() method such as usb.Serial. ipoll()
+# with nothing ready hands back the same spent iterator every time, so,
+# like MicroPython's, polling doesn't show up as heap churn in the bench.
+
+POLLIN = 1
+POLLOUT = 4
+POLLERR = 8
+POLLHUP = 16
+
+_NOTHING = iter(())
+
+
+class _Poll:
+
+    def __init__(self):
+        self._objs = [] # (obj, eventmask)
+
+    def register(self, obj, eventmask=POLLIN | POLLOUT):
+        self.unregister(obj)
+        self._objs.append((obj, eventmask))
+
+    def unregister(self, obj):
+        self._objs = [entry for entry in self._objs if entry[0] is not obj]
+
+    def modify(self, obj, eventmask):
+        self.register(obj, eventmask)
+
+    def poll(self, timeout=-1):
+        ready = []
+        for obj, mask in self._objs:
+            if mask & POLLIN and obj.pending():
+                ready.append((obj, POLLIN))
+        return ready
+
+    def ipoll(self, timeout=-1, flags=0):
+        for obj, mask in self._objs:
+            if mask & POLLIN and obj.pending():
+                return iter(self.poll(timeout))
+        return _NOTHING
+
+
+def poll():
+    return _Poll()
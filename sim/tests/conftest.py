@@ -0,0 +1,20 @@
+# Regression tests for the timer, run in the simulator
+#
+#   python -m pytest
+
+import pytest
+
+from sim import Simulator
+
+
+@pytest.fixture
+def sim():
+    s = Simulator()
+    s.run_for(1500) # past the splash
+    return s
+
+
+# without starting the timer, for testing modules on their own
+@pytest.fixture
+def pico():
+    return Simulator(start=False).modules
@@ -0,0 +1,175 @@
+# the relay should be closed for exactly what the display asked for
+
+from array import array
+
+import pytest
+
+TOLERANCE_US = 2 # the virtual clock's rounding
+
+
+def lit_us(sim, first):
+    return sum(off - on for on, off in sim.lamp_periods()[first:])
+
+
+def finish(sim):
+    v21 = sim.v21
+    sim.run_until(lambda: v21.state.mode != "Run" and v21.state.mode != "Paused")
+    sim.run_for(200)
+
+
+@pytest.mark.parametrize("base, clicks", [(0.3, 0), (2.0, 3), (8.0, -7)])
+def test_expose(sim, base, clicks):
+    v21 = sim.v21
+    v21.state.base = base
+    v21.set_stops(clicks)
+    sim.run_for(50)
+    sim.press("run")
+    duration = v21.state.run_duration
+    assert duration == v21.get_exposure_duration()
+    finish(sim)
+    assert v21.state.mode == "Expose"
+    periods = sim.lamp_periods()
+    assert len(periods) == 1
+    assert abs(lit_us(sim, 0) - duration) <= TOLERANCE_US
+
+
+def test_shortest_run(sim):
+    v21 = sim.v21
+    v21.state.base = 0.4
+    v21.set_stops(-99) # 0.4ms, less than the table holds
+    sim.run_for(50)
+    assert v21.get_exposure_duration() == 1000
+    sim.press("run")
+    finish(sim)
+    assert v21.state.mode == "Expose"
+    assert not v21.heap.holding
+    assert abs(lit_us(sim, 0) - 1000) <= TOLERANCE_US
+    # and it can't become the base
+    sim.press("set")
+    assert v21.state.base == 0.1
+
+
+def test_burn(sim):
+    v21 = sim.v21
+    v21.state.base = 2.0
+    sim.press("mode")
+    sim.turn(-4) # clockwise counts down on this wiring
+    sim.run_for(50)
+    assert v21.state.burn == 5
+    sim.press("run")
+    duration = v21.state.run_duration
+    assert duration == v21.get_burn_duration()
+    assert duration == v21.stop_table.burn_us(5)
+    finish(sim)
+    assert v21.state.mode == "Burn"
+    assert abs(lit_us(sim, 0) - duration) <= TOLERANCE_US
+
+
+def test_every_step_of_a_test_strip(sim):
+    v21 = sim.v21
+    v21.state.base = 1.0
+    sim.press("mode")
+    sim.press("mode")
+    steps = v21.state.steps
+    for step in range(steps):
+        first = len(sim.lamp_periods())
+        sim.press("run")
+        duration = v21.state.run_duration
+        assert duration == int(v21.strip.duration(step) * 1000000)
+        finish(sim)
+        assert abs(lit_us(sim, first) - duration) <= TOLERANCE_US
+    # back to the start of the strip
+    assert v21.state.mode == "Test"
+    assert v21.state.step == 0
+    assert len(sim.lamp_periods()) == steps
+
+
+@pytest.mark.parametrize("pauses", [1, 3])
+def test_pause_and_resume(sim, pauses):
+    v21 = sim.v21
+    v21.state.base = 6.0
+    v21.set_stops(0)
+    sim.run_for(50)
+    sim.press("run", hold_ms=40, settle_ms=0)
+    duration = v21.state.run_duration
+    for _ in range(pauses):
+        sim.run_for(1000)
+        sim.press("run", hold_ms=40, settle_ms=0)
+        assert v21.state.mode == "Paused"
+        assert not sim.lamp
+        sim.run_for(700)
+        sim.press("run", hold_ms=40, settle_ms=0)
+        assert v21.state.mode == "Run"
+    finish(sim)
+    assert len(sim.lamp_periods()) == pauses + 1
+    assert abs(lit_us(sim, 0) - duration) <= TOLERANCE_US * (pauses + 1)
+
+
+def test_program_waits_between_segments(sim):
+    v21 = sim.v21
+    v21.state.base = 2.0
+    v21.set_stops(0)
+    sim.press("mode")
+    sim.press("mode")
+    sim.press("mode")
+    assert v21.state.mode == "Program"
+    v21.state.burn = 5
+    sim.press("set", settle_ms=500) # waits for the card to be moved
+    v21.state.burn = 10
+    sim.press("set", settle_ms=500) # and this one too
+    sim.press("set", settle_ms=0)
+    sim.press("set", settle_ms=500) # a double press, runs straight on
+    sim.run_for(50)
+    assert len(v21.program) == 4
+    assert list(v21.program.waits[1:4]) == [1, 1, 0]
+
+    sim.press("run")
+    durations = list(v21.program.durations[:4])
+    assert durations[0] == v21.get_exposure_duration()
+    # the main exposure then the lamp off waiting for the card
+    sim.run_until(lambda: v21.state.mode == "Paused")
+    assert v21.state.segment == 1
+    sim.run_for(2000)
+    assert v21.state.mode == "Paused"
+    assert not sim.lamp
+    assert len(sim.lamp_periods()) == 1
+    sim.press("run")
+    sim.run_until(lambda: v21.state.mode == "Paused")
+    assert v21.state.segment == 2
+    sim.run_for(500)
+    # the last two segments run together with the lamp on
+    sim.press("run")
+    finish(sim)
+    assert v21.state.mode == "Program"
+    periods = sim.lamp_periods()
+    assert len(periods) == 3
+    lit = [off - on for on, off in periods]
+    assert abs(lit[0] - durations[0]) <= TOLERANCE_US
+    assert abs(lit[1] - durations[1]) <= TOLERANCE_US
+    assert abs(lit[2] - durations[2] - durations[3]) <= TOLERANCE_US
+    assert abs(sum(lit) - sum(durations)) <= TOLERANCE_US * 3
+
+
+def test_nothing_to_time(sim):
+    exposure = sim.v21.exposure
+    exposure.start(0)
+    assert exposure.finished
+    assert not exposure.running
+    assert sim.lamp_periods() == []
+
+
+def test_empty_program_segment(sim):
+    exposure = sim.v21.exposure
+    durations = array('i', [200000, 0, 300000])
+    exposure.start_program(durations, bytearray([0, 1, 0]), 3)
+    sim.run_until(lambda: exposure.waiting)
+    assert exposure.segment == 1
+    # nothing to do for the empty one, straight on to the next
+    exposure.resume()
+    assert exposure.segment == 2
+    assert exposure.running
+    sim.run_until(lambda: exposure.finished)
+    lit = [off - on for on, off in sim.lamp_periods()]
+    assert len(lit) == 2
+    assert abs(lit[0] - 200000) <= TOLERANCE_US
+    assert abs(lit[1] - 300000) <= TOLERANCE_US
@@ -0,0 +1,37 @@
+import pytest
+
+
+def test_durations_are_32_bit(pico):
+    # 'l' is 32 bits on the Pico, the simulator makes it so here too
+    assert pico["fstops"].StopTable().durations.itemsize == 4
+
+
+@pytest.mark.parametrize("resolution", (10, 6, 3))
+@pytest.mark.parametrize("base", (0.1, 16.0, 300.0, 2000.0, 100000.0))
+def test_every_click_fits(pico, resolution, base):
+    table = pico["fstops"].StopTable(resolution)
+    table.update(base) # OverflowError if an entry doesn't fit
+    assert table.duration_us(0) == round(base * 1000) * 1000
+    assert table.duration_us(table.limit) >= table.duration_us(table.limit - 1)
+    assert table.burn_us(0) == 0
+
+
+@pytest.mark.parametrize("resolution", (10, 6, 3))
+def test_nothing_under_a_millisecond(pico, resolution):
+    table = pico["fstops"].StopTable(resolution)
+    table.update(0.1)
+    assert table.duration_us(-table.limit) == 1000
+
+
+def test_a_stop_doubles(pico):
+    table = pico["fstops"].StopTable(10)
+    table.update(16.0)
+    assert table.duration_us(10) == 32000000
+    assert table.duration_us(-10) == 8000000
+    assert table.burn_us(10) == 16000000
+
+
+def test_labels(pico):
+    fstops = pico["fstops"]
+    assert [fstops.StopTable(10).label(c) for c in (-13, 0, 3, 99)] == ["-1.3", "0.0", "+0.3", "+9.9"]
+    assert [fstops.StopTable(3).label(c) for c in (-2, 1, 29)] == ["-0.67", "+0.33", "+9.67"]
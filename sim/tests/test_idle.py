@@ -0,0 +1,43 @@
+# the clock must be back to full speed before the buzzer's PWM starts
+
+import pytest
+
+from sim import machine
+
+
+# the clock each time a note was asked for
+def watch_buzzer(sim):
+    clocks = []
+    buzzer = sim.v21.buzzer
+    for name in ("play", "metronome"):
+        method = getattr(buzzer, name)
+        def wrapped(*args, method=method):
+            clocks.append(machine.freq_hz)
+            return method(*args)
+        setattr(buzzer, name, wrapped)
+    return clocks
+
+
+def slow_down(sim):
+    sim.run_for(3000)
+    assert sim.v21.idle.slow
+    assert machine.freq_hz == sim.modules["idle"].SLOW_HZ
+
+
+def test_resolution_beep(sim):
+    clocks = watch_buzzer(sim)
+    sim.press("mode")
+    slow_down(sim)
+    sim.press("set", hold_ms=1000)
+    assert sim.v21.stop_table.resolution == 6
+    assert clocks == [sim.v21.idle.full_hz]
+
+
+@pytest.mark.parametrize("mode", ["Expose", "Burn", "Test", "Program"])
+def test_focus_metronome(sim, mode):
+    sim.v21.state.mode = mode
+    clocks = watch_buzzer(sim)
+    slow_down(sim)
+    sim.press("focus")
+    assert sim.v21.state.mode == "Focus"
+    assert clocks == [sim.v21.idle.full_hz]
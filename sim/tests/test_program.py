@@ -0,0 +1,29 @@
+def test_compile(pico):
+    table = pico["fstops"].StopTable(10)
+    table.update(16.0)
+    program = pico["program"].ExposureProgram()
+    program.add(10)
+    program.add(5, wait=False)
+    assert program.compile(table, 0) == 3
+    assert list(program.durations[:3]) == [16000000, 16000000, table.burn_us(5)]
+    assert program.total_us() == sum(program.durations[:3])
+
+
+def test_too_long_to_run(pico):
+    table = pico["fstops"].StopTable(10)
+    table.update(600.0)
+    program = pico["program"].ExposureProgram()
+    program.add(10)
+    assert program.compile(table, 0) == 2
+    # 600s at +2 stops is over 2^31us
+    assert program.compile(table, 20) == 0
+    program.add(30) # a burn of 7 times the base
+    assert program.compile(table, 0) == 0
+
+
+def test_nothing_to_run(pico):
+    table = pico["fstops"].StopTable(10)
+    table.update(16.0)
+    program = pico["program"].ExposureProgram()
+    program.add(0) # a burn of no clicks
+    assert program.compile(table, 0) == 0
@@ -0,0 +1,154 @@
+import pytest
+
+
+# send a line and give the loop time to answer it
+def command(sim, line):
+    sim.serial.send(line)
+    sim.run_for(50)
+    return sim.serial.lines()
+
+
+def test_no_settings_part_way_through_a_test_strip(sim):
+    v21 = sim.v21
+    v21.state.base = 0.5
+    sim.press("mode")
+    sim.press("mode")
+    for _ in range(4):
+        sim.press("run")
+        sim.run_until(lambda: v21.state.mode == "Test")
+    assert v21.state.step == 4
+    for line in ("steps 3", "interval 0.2", "base 2", "stops 1", "burn 1", "res 3"):
+        assert command(sim, line) == ["err busy"]
+    sim.run_for(500)
+    assert v21.state.steps == 7
+    # the next step still runs
+    assert command(sim, "run")[0].startswith("ok")
+
+
+def test_reports_without_the_repl(sim):
+    sim.v21.watchdog.start(wdt=True)
+    sim.run_for(100)
+    lines = command(sim, "wd")
+    assert lines[0].startswith("iterations")
+    assert any("display worst" in line for line in lines)
+    assert lines[-1] == "ok"
+    assert command(sim, "heap")[0].startswith("free heap now")
+    assert command(sim, "idle")[0].startswith("slowdowns")
+
+
+def test_profiler(sim):
+    assert command(sim, "prof report") == ["err not started"]
+    assert command(sim, "prof on") == ["ok"]
+    sim.v21.state.base = 1.0
+    sim.press("run")
+    sim.run_until(lambda: sim.v21.state.mode != "Run")
+    lines = command(sim, "prof report Run")
+    assert lines[1] == "Run"
+    assert any(line.startswith("display") for line in lines)
+    assert "Expose" not in lines
+    assert lines[-1] == "ok"
+    assert command(sim, "prof report Nonsense") == ["err range"]
+    assert command(sim, "prof off") == ["ok"]
+    assert sim.v21.watchdog.profiler is None
+
+
+def test_stream(sim):
+    v21 = sim.v21
+    assert command(sim, "stream on") == ["ok"]
+    assert command(sim, "base 2") == ["ok", "ev base=2.0"]
+    assert command(sim, "stops -0.3") == ["ok", "ev stops=-3"]
+    sim.serial.send("run")
+    sim.run_until(lambda: v21.state.mode == "Run")
+    sim.run_until(lambda: v21.state.mode != "Run")
+    sim.run_for(200)
+    lines = sim.serial.lines()
+    assert "ev mode=Run" in lines
+    assert "ev run_duration=%d" % v21.state.run_duration in lines
+    tenths = [line for line in lines if line.startswith("ev run_remaining_tenths=")]
+    assert tenths[-2:] == ["ev run_remaining_tenths=1", "ev run_remaining_tenths=0"]
+    assert not any(line.startswith("ev run_remaining=") for line in lines)
+    assert lines[-1] == "ev mode=Expose"
+
+
+SETTINGS = ("base 2", "stops 0.5", "burn 0.3", "res 6", "steps 9", "interval 0.2")
+
+
+@pytest.mark.parametrize("mode", ["Expose", "Burn", "Test", "Program"])
+def test_settings_in_each_mode(sim, mode):
+    v21 = sim.v21
+    assert command(sim, "mode " + mode) == ["ok"]
+    assert v21.state.mode == mode
+    for line in SETTINGS:
+        assert command(sim, line) == ["ok"]
+    s = v21.state
+    assert (s.base, s.stops, s.burn, s.steps, s.interval) == (2.0, 3, 2, 9, 0.2)
+    assert v21.stop_table.resolution == 6
+    assert command(sim, "pause") == ["err not running"]
+    assert command(sim, "cancel") == ["err not running"]
+    assert command(sim, "run")[0] == "ok %d" % v21.state.run_duration
+    assert v21.state.mode == "Run"
+
+
+def test_busy_in_focus(sim):
+    sim.press("focus")
+    assert sim.v21.state.mode == "Focus"
+    for line in SETTINGS + ("mode Burn", "run"):
+        assert command(sim, line) == ["err busy"]
+    assert command(sim, "pause") == ["err not running"]
+
+
+def test_run_pause_and_cancel(sim):
+    v21 = sim.v21
+    assert command(sim, "base 5") == ["ok"]
+    assert command(sim, "run")[0].startswith("ok")
+    for line in SETTINGS + ("mode Burn", "run"):
+        assert command(sim, line) == ["err busy"]
+    assert command(sim, "pause") == ["ok"]
+    assert v21.state.mode == "Paused"
+    assert not sim.lamp
+    for line in SETTINGS + ("mode Burn", "pause"):
+        assert command(sim, line)[0].startswith("err")
+    assert command(sim, "run")[0].startswith("ok")
+    assert v21.state.mode == "Run"
+    assert sim.lamp
+    assert command(sim, "cancel") == ["ok"]
+    assert v21.state.mode == "Expose"
+    assert not sim.lamp
+    assert command(sim, "state")[0].startswith("ok ")
+
+
+@pytest.mark.parametrize("line", ["base nan", "base inf", "base -inf", "base 0", "base 3000000",
+                                  "interval nan", "interval inf", "interval 0",
+                                  "stops nan", "stops inf", "burn inf", "steps inf"])
+def test_values_out_of_range(sim, line):
+    v21 = sim.v21
+    before = (v21.state.base, v21.state.interval, v21.state.stops, v21.state.burn)
+    assert command(sim, line)[0] in ("err range", "err bad value")
+    assert (v21.state.base, v21.state.interval, v21.state.stops, v21.state.burn) == before
+    # and the loop is still going
+    sim.run_for(100)
+    assert command(sim, "base 2") == ["ok"]
+
+
+def test_run_refused(sim):
+    v21 = sim.v21
+    assert command(sim, "base 600") == ["ok"]
+    assert command(sim, "run")[0].startswith("ok")
+    assert command(sim, "cancel") == ["ok"]
+    # a burn of +3 stops on 600s is more than a segment can time
+    assert command(sim, "mode Program") == ["ok"]
+    v21.program.add(30)
+    assert command(sim, "run") == ["err not started"]
+    assert v21.state.mode == "Program"
+
+
+def test_log(sim):
+    v21 = sim.v21
+    assert command(sim, "log") == ["ok"] # nothing yet
+    v21.state.base = 0.5
+    assert command(sim, "run")[0].startswith("ok")
+    sim.run_until(lambda: v21.state.mode == "Expose")
+    lines = command(sim, "log")
+    assert lines[0].startswith("exposures 1 mean overshoot")
+    assert lines[1].startswith("last overshoots (us):")
+    assert lines[-1] == "ok"
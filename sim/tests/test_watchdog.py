@@ -0,0 +1,28 @@
+# the supervisor cuts the lamp when the loop stalls, the exposure must
+# come back paused from that moment however long the stall
+
+import pytest
+
+
+@pytest.mark.parametrize("stall_ms", [400, 1500]) # ends before, and after, the deadline
+def test_stall_pauses_the_exposure(sim, stall_ms):
+    v21 = sim.v21
+    v21.watchdog.start()
+    v21.state.base = 1.0
+    v21.set_stops(0)
+    sim.run_for(50)
+    sim.press("run", hold_ms=40, settle_ms=0)
+    sim.run_for(300)
+    # stuck in one long C call, soft callbacks wait for the end of it
+    sim.clock.advance(stall_ms * 1000, atomic=True)
+    sim.run_for(100)
+    assert v21.state.mode == "Paused"
+    assert v21.watchdog.cuts == 1
+    (on, off), = sim.lamp_periods()
+    assert off == pytest.approx(v21.watchdog.cut_us, abs=1)
+    assert v21.state.run_remaining == pytest.approx(1000000 - (off - on), abs=2)
+    # and resuming makes up the rest
+    sim.press("run", hold_ms=40, settle_ms=0)
+    sim.run_until(lambda: v21.state.mode == "Expose")
+    assert sum(off - on for on, off in sim.lamp_periods()) == pytest.approx(1000000, abs=2)
+    assert v21.exposure_log.count == 0 # not taken for an exposure that ran straight through
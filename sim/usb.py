@@ -0,0 +1,45 @@
+# Fake USB serial port
+#
+# Stands in for sys.stdin and sys.stdout as far as remote.py is concerned:
+# send() queues a line as if typed on the computer and everything the
+# timer writes back is collected in `output`.
+
+
+class Serial:
+
+    def __init__(self):
+        self._in = bytearray()
+        self.output = []
+
+    # ---- the computer's side
+
+    def send(self, line):
+        self._in += line.encode() + b"\n"
+
+    # complete lines written so far, which are then forgotten
+    def lines(self):
+        text = "".join(self.output)
+        self.output = []
+        done, _, rest = text.rpartition("\n")
+        if rest:
+            self.output.append(rest)
+        return done.split("\n") if done else []
+
+    # ---- the timer's side
+
+    def pending(self):
+        return len(self._in)
+
+    def read(self, n=-1):
+        if n < 0:
+            n = len(self._in)
+        data = bytes(self._in[:n])
+        del self._in[:n]
+        return data.decode()
+
+    # text, or the first n bytes of a buffer like MicroPython's streams
+    def write(self, data, n=None):
+        if not isinstance(data, str):
+            data = bytes(data[:n] if n is not None else data).decode()
+        self.output.append(data)
+        return len(data)
@@ -0,0 +1,50 @@
+# Fake time module
+#
+# Installed as `time` while the pico modules are imported, so their
+# ticks_ms, ticks_diff and sleep all run off the virtual clock.
+
+from sim import machine
+
+TICKS_US_COST = 0.5
+
+
+def ticks_ms():
+    return machine.clock.ticks_ms()
+
+
+def ticks_us():
+    # reading the counter takes a moment, which also lets busy-waits finish
+    machine.clock.advance(TICKS_US_COST)
+    return machine.clock.ticks_us()
+
+
+def ticks_cpu():
+    return machine.clock.ticks_cpu()
+
+
+def ticks_add(ticks, delta):
+    return machine.clock.ticks_add(ticks, delta)
+
+
+def ticks_diff(end, start):
+    return machine.clock.ticks_diff(end, start)
+
+
+def sleep(seconds):
+    machine.clock.advance(seconds * 1000000)
+
+
+def sleep_ms(ms):
+    machine.clock.advance(ms * 1000)
+
+
+def sleep_us(us):
+    machine.clock.advance(us)
+
+
+def time():
+    return int(machine.clock.now_us // 1000000)
+
+
+def time_ns():
+    return int(machine.clock.now_us * 1000)
@@ -0,0 +1,67 @@
+# Build the firmware into MicroPython bytecode
+#
+# The Pico compiles every .py file it imports each time it boots. Copying
+# precompiled .mpy files instead saves that time and the heap it uses.
+#
+#   python tools/build_mpy.py                  # writes build/pico
+#   mpremote cp -r build/pico/ :               # then copy it over
+#
+# mpy-cross must be the same version as the MicroPython on the Pico
+# (pip install mpy-cross==<version>, or build it from the MicroPython
+# source). MicroPython imports a .py in preference to a .mpy of the same
+# name, so delete the old .py files from the Pico first.
+#
+# main.py has to stay source for the Pico to run it, so the timer itself
+# is compiled as v21.mpy and main.py becomes a two line stub that starts it.
+# After a Ctrl-C the timer is at v21.v21_timer in the REPL.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PICO_DIR = os.path.join(ROOT, "pico")
+
+STUB = "import v21\nv21.main()\n"
+
+
+def modules():
+    # everything the timer imports, not the hardware test scripts
+    for name in sorted(os.listdir(PICO_DIR)):
+        if name.endswith(".py") and not name.startswith("test_"):
+            yield name
+
+
+def compile_one(mpy_cross, march, source, target):
+    subprocess.run([mpy_cross, "-march=" + march, "-o", target, source], check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the pico modules to .mpy")
+    parser.add_argument("--out", default=os.path.join(ROOT, "build", "pico"), help="where to put the files")
+    parser.add_argument("--mpy-cross", default="mpy-cross", help="the mpy-cross to use")
+    parser.add_argument("--march", default="armv6m", help="armv6m for the RP2040")
+    args = parser.parse_args()
+
+    if shutil.which(args.mpy_cross) is None:
+        sys.exit("can't find %s, see the top of this file" % args.mpy_cross)
+
+    if os.path.isdir(args.out):
+        shutil.rmtree(args.out)
+    os.makedirs(args.out)
+
+    for name in modules():
+        source = os.path.join(PICO_DIR, name)
+        module = "v21" if name == "main.py" else name[:-3]
+        compile_one(args.mpy_cross, args.march, source, os.path.join(args.out, module + ".mpy"))
+        print(name, "->", module + ".mpy")
+
+    with open(os.path.join(args.out, "main.py"), "w") as f:
+        f.write(STUB)
+    print("main.py (stub)")
+
+
+if __name__ == "__main__":
+    main()